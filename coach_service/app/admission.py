@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from typing import Optional
+import time
+
+from .config import settings
+from .telemetry import SUGGESTION_TIER_RUNS
+
+
+TIERS = ("full", "no_llm", "no_rerank", "cached_only")
+FULL, NO_LLM, NO_RERANK, CACHED_ONLY = range(len(TIERS))
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        enabled: bool,
+        queue_high: int,
+        latency_high_ms: float,
+        latency_low_ms: float,
+        step_sec: float,
+        recover_sec: float,
+        smoothing: float,
+    ) -> None:
+        self.enabled = enabled
+        self.queue_high = max(1, queue_high)
+        self.latency_high_ms = latency_high_ms
+        self.latency_low_ms = latency_low_ms
+        self.step_sec = step_sec
+        self.recover_sec = recover_sec
+        self.smoothing = smoothing
+        self.level = FULL
+        self.depth = 0
+        self.latency_ms = 0.0
+        self.changed_at = time.monotonic()
+        self.calm_since: Optional[float] = None
+        self.changes = 0
+        self.runs = [0] * len(TIERS)
+
+    @property
+    def tier(self) -> str:
+        return TIERS[self.level]
+
+    def admit(self, depth: int) -> int:
+        self.depth = depth
+        if self.enabled:
+            self._update(time.monotonic())
+        self.runs[self.level] += 1
+        SUGGESTION_TIER_RUNS.labels(self.tier).inc()
+        return self.level
+
+    def observe(self, seconds: float) -> None:
+        self.latency_ms += self.smoothing * (seconds * 1000 - self.latency_ms)
+
+    def _update(self, now: float) -> None:
+        overloaded = self.depth > self.queue_high or self.latency_ms > self.latency_high_ms
+        calm = self.depth <= self.queue_high // 2 and self.latency_ms < self.latency_low_ms
+        if overloaded:
+            self.calm_since = None
+            if self.level < CACHED_ONLY and now - self.changed_at >= self.step_sec:
+                self._set(self.level + 1, now)
+        elif not calm:
+            self.calm_since = None
+        elif self.calm_since is None:
+            self.calm_since = now
+        elif self.level > FULL and now - max(self.calm_since, self.changed_at) >= self.recover_sec:
+            self._set(self.level - 1, now)
+
+    def _set(self, level: int, now: float) -> None:
+        self.level = level
+        self.changed_at = now
+        self.changes += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "tier": self.tier,
+            "queue_depth": self.depth,
+            "queue_high": self.queue_high,
+            "latency_ms": round(self.latency_ms, 1),
+            "tier_changes": self.changes,
+            "runs": dict(zip(TIERS, self.runs)),
+        }
+
+
+def create_admission(workers: int) -> AdmissionController:
+    return AdmissionController(
+        enabled=settings.admission_control,
+        queue_high=settings.admission_queue_high or workers,
+        latency_high_ms=settings.admission_latency_high_ms,
+        latency_low_ms=settings.admission_latency_low_ms,
+        step_sec=settings.admission_step_sec,
+        recover_sec=settings.admission_recover_sec,
+        smoothing=settings.admission_smoothing,
+    )
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Awaitable, Callable, List
+import asyncio
+import json
+import logging
+
+from .telemetry import AUDIO_CHUNKS_DECODED, stage_timer
+
+if TYPE_CHECKING:
+    from vosk import Model
+
+
+logger = logging.getLogger(__name__)
+
+AUDIO_TIMER = stage_timer("audio_decode")
+
+
+@dataclass
+class AudioStats:
+    chunks_received: int = 0
+    chunks_decoded: int = 0
+    chunks_coalesced: int = 0
+    bytes_decoded: int = 0
+    backpressure_waits: int = 0
+
+
+@dataclass
+class AudioEvent:
+    final: bool
+    text: str
+
+
+class AudioStream:
+    def __init__(
+        self,
+        model: "Model",
+        executor: Executor,
+        stats: AudioStats,
+        max_pending_bytes: int,
+        max_decode_bytes: int,
+        sample_rate: int = 16000,
+    ) -> None:
+        from vosk import KaldiRecognizer
+
+        self.recognizer = KaldiRecognizer(model, sample_rate)
+        self.executor = executor
+        self.stats = stats
+        self.max_pending_bytes = max_pending_bytes
+        self.max_decode_bytes = max_decode_bytes
+        self.pending: List[bytes] = []
+        self.pending_bytes = 0
+        self.ready = asyncio.Event()
+        self.capacity = asyncio.Event()
+        self.capacity.set()
+
+    async def offer(self, chunk: bytes) -> None:
+        if not self.capacity.is_set():
+            self.stats.backpressure_waits += 1
+            await self.capacity.wait()
+        self.stats.chunks_received += 1
+        self.pending.append(chunk)
+        self.pending_bytes += len(chunk)
+        if self.pending_bytes >= self.max_pending_bytes:
+            self.capacity.clear()
+        self.ready.set()
+
+    async def run(self, on_event: Callable[[AudioEvent], Awaitable[None]]) -> None:
+        try:
+            await self._run(on_event)
+        finally:
+            self.capacity.set()
+
+    async def _run(self, on_event: Callable[[AudioEvent], Awaitable[None]]) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            chunks, self.pending, self.pending_bytes = self.pending, [], 0
+            self.capacity.set()
+            if not chunks:
+                continue
+            if len(chunks) > 1:
+                self.stats.chunks_coalesced += len(chunks) - 1
+            try:
+                events = await loop.run_in_executor(self.executor, self._timed_decode, b"".join(chunks))
+            except Exception:
+                logger.exception("Audio decode failed")
+                continue
+            self.stats.chunks_decoded += len(chunks)
+            AUDIO_CHUNKS_DECODED.inc(len(chunks))
+            for event in events:
+                try:
+                    await on_event(event)
+                except Exception:
+                    logger.exception("Audio event handler failed")
+
+    @staticmethod
+    def warm_up(model: "Model", sample_rate: int = 16000) -> None:
+        from vosk import KaldiRecognizer
+
+        KaldiRecognizer(model, sample_rate).AcceptWaveform(b"\0" * 3200)
+
+    def _timed_decode(self, data: bytes) -> List[AudioEvent]:
+        with AUDIO_TIMER.time():
+            return self._decode(data)
+
+    def _decode(self, data: bytes) -> List[AudioEvent]:
+        events: List[AudioEvent] = []
+        partial = None
+        for start in range(0, len(data), self.max_decode_bytes):
+            piece = data[start:start + self.max_decode_bytes]
+            self.stats.bytes_decoded += len(piece)
+            if self.recognizer.AcceptWaveform(piece):
+                text = json.loads(self.recognizer.Result()).get("text", "").strip()
+                events.append(AudioEvent(final=True, text=text))
+                partial = None
+            else:
+                partial = json.loads(self.recognizer.PartialResult()).get("partial", "").strip()
+        if partial:
+            events.append(AudioEvent(final=False, text=partial))
+        return events
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Sequence
+import os
+import queue
+import threading
+import time
+
+
+@dataclass
+class BatchRequest:
+    items: List[Any]
+    future: Future = field(default_factory=Future)
+
+
+@dataclass
+class BatchStats:
+    batches: int = 0
+    items: int = 0
+    requests: int = 0
+    full_batches: int = 0
+    largest_batch: int = 0
+
+    def as_dict(self, max_batch: int) -> dict:
+        mean_size = self.items / self.batches if self.batches else 0.0
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "requests": self.requests,
+            "full_batches": self.full_batches,
+            "largest_batch": self.largest_batch,
+            "mean_batch_size": mean_size,
+            "mean_fill": mean_size / max_batch if max_batch else 0.0,
+        }
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[List[Any]], Sequence[Any]],
+        window_ms: float,
+        max_batch: int,
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.window_sec = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.stats = BatchStats()
+        self._start()
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self) -> None:
+        self.queue: "queue.Queue[BatchRequest]" = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name=f"batch-{self.name}", daemon=True)
+        self.thread.start()
+
+    def run(self, items: List[Any]) -> Sequence[Any]:
+        request = BatchRequest(items=list(items))
+        self.queue.put(request)
+        return request.future.result()
+
+    def _collect(self) -> List[BatchRequest]:
+        first = self.queue.get()
+        batch = [first]
+        size = len(first.items)
+        deadline = time.monotonic() + self.window_sec
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.items)
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            flat = [item for request in batch for item in request.items]
+            self._record(len(batch), len(flat))
+            try:
+                outputs = self.fn(flat)
+            except Exception as exc:
+                for request in batch:
+                    request.future.set_exception(exc)
+                continue
+            offset = 0
+            for request in batch:
+                count = len(request.items)
+                request.future.set_result(outputs[offset:offset + count])
+                offset += count
+
+    def _record(self, requests: int, items: int) -> None:
+        stats = self.stats
+        stats.batches += 1
+        stats.requests += requests
+        stats.items += items
+        stats.largest_batch = max(stats.largest_batch, items)
+        if items >= self.max_batch:
+            stats.full_batches += 1
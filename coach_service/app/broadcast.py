@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set, Union
+import asyncio
+import json
+import logging
+import time
+
+from fastapi import WebSocket
+
+from .schemas import LiveMetrics
+from .sessions import SessionRegistry, SessionState
+from .wire import accept, packb
+
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_STREAM = ""
+SLOW_CLIENT_POLICIES = {"drop", "disconnect"}
+
+
+class ControlMessage(str):
+    pass
+
+
+@dataclass(eq=False)
+class UIClient:
+    websocket: WebSocket
+    stream: str
+    delta: bool
+    queue: asyncio.Queue
+    binary: bool = False
+    needs_full: bool = True
+    dropped: int = 0
+    sender: Optional[asyncio.Task] = None
+
+
+@dataclass
+class StreamState:
+    last: Dict = field(default_factory=dict)
+    full_text: str = ""
+    full_bin: Optional[bytes] = None
+    pushed_at: float = 0.0
+
+    def full_binary(self) -> bytes:
+        if self.full_bin is None:
+            self.full_bin = packb(self.last)
+        return self.full_bin
+
+
+class UIBroadcaster:
+    def __init__(
+        self,
+        sessions: SessionRegistry,
+        min_interval: float,
+        heartbeat_sec: float,
+        max_queue: int,
+        slow_client_policy: str,
+    ) -> None:
+        if slow_client_policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy: {slow_client_policy}")
+        self.sessions = sessions
+        self.min_interval = min_interval
+        self.heartbeat_sec = heartbeat_sec
+        self.max_queue = max_queue
+        self.slow_client_policy = slow_client_policy
+        self.clients: Dict[str, Set[UIClient]] = {}
+        self.streams: Dict[str, StreamState] = {}
+        self.dirty: Set[str] = set()
+        self.wakeup = asyncio.Event()
+        self.pushes = 0
+        self.dropped = 0
+        self.slow_disconnects = 0
+        sessions.listeners.append(self.notify)
+
+    def client_count(self) -> int:
+        return sum(len(clients) for clients in self.clients.values())
+
+    def notify(self, session: SessionState) -> None:
+        self.dirty.add(session.session_id)
+        self.dirty.add(GLOBAL_STREAM)
+        self.wakeup.set()
+
+    async def connect(
+        self, websocket: WebSocket, session_id: Optional[str], delta: bool, fmt: str = "json"
+    ) -> UIClient:
+        binary = await accept(websocket, fmt)
+        client = UIClient(
+            websocket=websocket,
+            stream=session_id or GLOBAL_STREAM,
+            delta=delta,
+            queue=asyncio.Queue(maxsize=self.max_queue),
+            binary=binary,
+        )
+        self.clients.setdefault(client.stream, set()).add(client)
+        client.sender = asyncio.create_task(self._send_loop(client))
+        stream = self.streams.get(client.stream)
+        if stream is not None and stream.full_text:
+            full = stream.full_binary() if binary else stream.full_text
+            self._deliver(client, full, full)
+        else:
+            self.dirty.add(client.stream)
+            self.wakeup.set()
+        return client
+
+    def disconnect(self, client: UIClient) -> None:
+        clients = self.clients.get(client.stream)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del self.clients[client.stream]
+                self.streams.pop(client.stream, None)
+        if client.sender is not None and client.sender is not asyncio.current_task():
+            client.sender.cancel()
+
+    def send_control(self, client: UIClient, text: str) -> None:
+        try:
+            client.queue.put_nowait(ControlMessage(text))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.heartbeat_sec)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            dirty, self.dirty = self.dirty, set()
+            for key in dirty:
+                self._publish(key, heartbeat=False)
+            now = time.monotonic()
+            for key, stream in list(self.streams.items()):
+                if key not in dirty and now - stream.pushed_at >= self.heartbeat_sec:
+                    self._publish(key, heartbeat=True)
+            if self.min_interval > 0:
+                await asyncio.sleep(self.min_interval)
+
+    def _metrics_for(self, key: str) -> Optional[LiveMetrics]:
+        session = self.sessions.latest() if key == GLOBAL_STREAM else self.sessions.get(key)
+        return session.last_metrics if session is not None else None
+
+    def _publish(self, key: str, heartbeat: bool) -> None:
+        clients = self.clients.get(key)
+        if not clients:
+            return
+        metrics = self._metrics_for(key)
+        if metrics is None:
+            return
+        data = metrics.model_dump()
+        stream = self.streams.setdefault(key, StreamState())
+        if data == stream.last and not heartbeat:
+            return
+        delta = {k: v for k, v in data.items() if stream.last.get(k) != v}
+        full_text = metrics.model_dump_json()
+        delta_text = full_text if heartbeat else json.dumps(delta)
+        stream.last = data
+        stream.full_text = full_text
+        stream.full_bin = None
+        stream.pushed_at = time.monotonic()
+        self.pushes += 1
+        delta_bin: Optional[bytes] = None
+        if any(client.binary for client in clients):
+            delta_bin = stream.full_binary() if heartbeat else packb(delta)
+        for client in list(clients):
+            if client.binary:
+                self._deliver(client, delta_bin, stream.full_binary())
+            else:
+                self._deliver(client, delta_text, full_text)
+
+    def _deliver(self, client: UIClient, delta: Union[str, bytes], full: Union[str, bytes]) -> None:
+        payload = delta if client.delta and not client.needs_full else full
+        try:
+            client.queue.put_nowait(payload)
+            client.needs_full = False
+            return
+        except asyncio.QueueFull:
+            pass
+        self.dropped += 1
+        client.dropped += 1
+        if self.slow_client_policy == "disconnect":
+            self.slow_disconnects += 1
+            self.disconnect(client)
+            asyncio.create_task(self._close(client))
+            return
+        controls = []
+        while not client.queue.empty():
+            item = client.queue.get_nowait()
+            if isinstance(item, ControlMessage):
+                controls.append(item)
+        for item in controls[max(0, len(controls) - self.max_queue + 1):]:
+            client.queue.put_nowait(item)
+        client.queue.put_nowait(full)
+        client.needs_full = False
+
+    async def _close(self, client: UIClient) -> None:
+        try:
+            await client.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def _send_loop(self, client: UIClient) -> None:
+        try:
+            while True:
+                payload = await client.queue.get()
+                if isinstance(payload, bytes):
+                    await client.websocket.send_bytes(payload)
+                else:
+                    await client.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.debug("Dropping UI client after send failure", exc_info=True)
+            self.disconnect(client)
+
+    def stats(self) -> dict:
+        return {
+            "clients": self.client_count(),
+            "streams": len(self.clients),
+            "pushes": self.pushes,
+            "dropped": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+        }
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Hashable, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+Items = List[Tuple[Hashable, Any]]
+
+
+@dataclass(frozen=True)
+class CacheCodec:
+    extension: str
+    dump: Callable[[Items, IO[bytes]], None]
+    load: Callable[[IO[bytes]], Items]
+
+
+def dump_vectors(items: Items, handle: IO[bytes]) -> None:
+    keys = np.array([key for key, _ in items], dtype=str)
+    vectors = np.stack([vec for _, vec in items]) if items else np.zeros((0, 0), dtype=np.float32)
+    np.savez(handle, keys=keys, vectors=vectors)
+
+
+def load_vectors(handle: IO[bytes]) -> Items:
+    with np.load(handle, allow_pickle=False) as data:
+        return [(key, vec.copy()) for key, vec in zip(data["keys"].tolist(), data["vectors"])]
+
+
+def dump_scores(items: Items, handle: IO[bytes]) -> None:
+    rows = [[context_key, line, score] for (context_key, line), score in items]
+    handle.write(json.dumps(rows).encode("utf-8"))
+
+
+def load_scores(handle: IO[bytes]) -> Items:
+    return [((str(context_key), str(line)), float(score)) for context_key, line, score in json.load(handle)]
+
+
+VECTOR_CODEC = CacheCodec(".npz", dump_vectors, load_vectors)
+SCORE_CODEC = CacheCodec(".json", dump_scores, load_scores)
+
+
+def cache_path(cache_dir: str, name: str, model_name: str, codec: CacheCodec) -> str:
+    slug = model_name.replace("/", "__")
+    return os.path.join(cache_dir, f"{name}-{slug}{codec.extension}")
+
+
+class LRUCache:
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        max_bytes: int,
+        sizeof: Callable[[Hashable, Any], int],
+        codec: Optional[CacheCodec] = None,
+    ) -> None:
+        self.name = name
+        self.codec = codec
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(key, value)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= self.sizeof(key, previous)
+            self.entries[key] = value
+            self.bytes += size
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                old_key, old_value = self.entries.popitem(last=False)
+                self.bytes -= self.sizeof(old_key, old_value)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self, path: str) -> None:
+        if self.codec is None:
+            raise ValueError(f"Cache {self.name} has no codec")
+        with self.lock:
+            items = list(self.entries.items())
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as handle:
+            self.codec.dump(items, handle)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        if self.codec is None or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "rb") as handle:
+                items = self.codec.load(handle)
+            for key, value in items:
+                self.put(key, value)
+        except Exception:
+            logger.warning("Ignoring unreadable cache file %s", path)
+            self.clear()
+            return 0
+        return len(items)
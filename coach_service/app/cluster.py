@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+import json
+import os
+import time
+import zlib
+
+
+@dataclass
+class WorkerInfo:
+    worker_id: int = -1
+    workers: int = 1
+    state_dir: str = ""
+
+    @property
+    def enabled(self) -> bool:
+        return self.worker_id >= 0
+
+    def snapshot_path(self, worker_id: Optional[int] = None) -> str:
+        worker_id = self.worker_id if worker_id is None else worker_id
+        return os.path.join(self.state_dir, f"worker-{worker_id}.json")
+
+
+def socket_path(state_dir: str, worker_id: int) -> str:
+    return os.path.join(state_dir, f"worker-{worker_id}.sock")
+
+
+worker = WorkerInfo()
+
+
+def configure(worker_id: int, workers: int, state_dir: str) -> None:
+    worker.worker_id = worker_id
+    worker.workers = workers
+    worker.state_dir = state_dir
+
+
+def route(session_id: str, workers: int) -> int:
+    if not session_id:
+        return 0
+    return zlib.crc32(session_id.encode("utf-8")) % workers
+
+
+def write_snapshot(payload: dict) -> None:
+    path = worker.snapshot_path()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as handle:
+        json.dump({"worker": worker.worker_id, "pid": os.getpid(), "time": time.time(), **payload}, handle)
+    os.replace(tmp, path)
+
+
+def read_snapshots(max_age_sec: float) -> Dict[int, dict]:
+    snapshots: Dict[int, dict] = {}
+    now = time.time()
+    for worker_id in range(worker.workers):
+        if worker_id == worker.worker_id:
+            continue
+        try:
+            with open(worker.snapshot_path(worker_id), encoding="utf-8") as handle:
+                snapshot = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        if now - snapshot.get("time", 0) <= max_age_sec:
+            snapshots[worker_id] = snapshot
+    return snapshots
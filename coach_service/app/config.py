@@ -1,12 +1,83 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+import os
 
 
 @dataclass
 class Settings:
-    ui_push_interval_sec: float = 1.0
+    ui_min_push_interval_sec: float = 0.05
+    ui_heartbeat_sec: float = 5.0
+    ui_client_queue_size: int = 16
+    ui_slow_client_policy: str = "drop"
     max_history: int = 50
+    ingest_batch_max: int = 5000
+    ingest_ack_every: int = 1
+    transcript_log: bool = field(default_factory=lambda: os.getenv("COACH_TRANSCRIPT_LOG", "1") == "1")
+    transcript_dir: str = field(default_factory=lambda: os.getenv("COACH_TRANSCRIPT_DIR", ""))
+    transcript_resume_sec: float = 1800.0
+    transcript_flush_interval_sec: float = 1.0
+    transcript_retention_hours: float = field(
+        default_factory=lambda: float(os.getenv("COACH_TRANSCRIPT_RETENTION_HOURS", "72"))
+    )
+    transcript_prune_interval_sec: float = 3600.0
+    summary_key_lines: int = 5
+    summary_bucket_sec: float = 60.0
+    summary_max_buckets: int = 720
+    summary_checkpoint_every: int = 500
     model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
-    top_k: int = 5
+    top_k: int = 16
+    rerank_shortlist: int = 8
+    inference_backend: str = field(default_factory=lambda: os.getenv("COACH_INFERENCE_BACKEND", "torch"))
+    inference_model_file: str = field(default_factory=lambda: os.getenv("COACH_INFERENCE_MODEL_FILE", ""))
+    inference_threads: int = field(default_factory=lambda: int(os.getenv("COACH_INFERENCE_THREADS", "0")))
+    default_session_id: str = "default"
+    session_ttl_sec: float = 1800.0
+    max_sessions: int = 1000
+    session_sweep_interval_sec: float = 60.0
+    pipeline_mode: str = "thread"
+    pipeline_workers: int = 16
+    llm_workers: int = 1
+    admission_control: bool = field(default_factory=lambda: os.getenv("COACH_ADMISSION_CONTROL", "1") == "1")
+    admission_queue_high: int = 0
+    admission_latency_high_ms: float = 250.0
+    admission_latency_low_ms: float = 80.0
+    admission_step_sec: float = 1.0
+    admission_recover_sec: float = 5.0
+    admission_smoothing: float = 0.3
+    bandit_db: str = field(default_factory=lambda: os.getenv("COACH_BANDIT_DB", ""))
+    bandit_strategy: str = field(default_factory=lambda: os.getenv("COACH_BANDIT_STRATEGY", "mean"))
+    bandit_ucb_c: float = 1.0
+    bandit_flush_interval_sec: float = 5.0
+    workers: int = field(default_factory=lambda: int(os.getenv("COACH_WORKERS", str(os.cpu_count() or 1))))
+    state_dir: str = field(default_factory=lambda: os.getenv("COACH_STATE_DIR", "/tmp/coach-service"))
+    stats_snapshot_interval_sec: float = 2.0
+    router_max_peek_body_mb: int = 16
+    audio_final_min_interval_sec: float = 1.5
+    audio_workers: int = field(default_factory=lambda: os.cpu_count() or 4)
+    audio_max_pending_bytes: int = 64000
+    audio_max_decode_bytes: int = 8000
+    audio_ack_every: int = 0
+    suggestion_cache_entries: int = 20000
+    suggestion_cache_mb: int = 32
+    suggestion_sentiment_bucket: float = 0.25
+    batch_inference: bool = True
+    batch_window_ms: float = 4.0
+    batch_max_size: int = 64
+    embedding_cache_entries: int = 50000
+    embedding_cache_mb: int = 128
+    score_cache_entries: int = 200000
+    score_cache_mb: int = 64
+    cache_dir: str = field(default_factory=lambda: os.getenv("COACH_CACHE_DIR", ""))
+    playbook_dir: str = field(default_factory=lambda: os.getenv("COACH_PLAYBOOK_DIR", ""))
+    playbook_nprobe: int = 16
+    playbook_ef_search: int = 64
+    playbook_exact_scan_max: int = 20000
+    vision_decode_scale: int = 4
+    vision_max_fps: float = 5.0
+    vision_workers: int = 4
+    vision_tracking: bool = True
+    vision_detect_interval: int = 10
+    vision_track_min_score: float = 0.6
+    vision_gaze_smoothing: float = 0.3
 
 
 settings = Settings()
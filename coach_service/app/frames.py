@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from typing import Callable, Optional
+import asyncio
+import logging
+import time
+
+from .telemetry import FRAMES_ANALYZED, FRAMES_DROPPED, stage_timer
+from .vision import FaceTrack, VisionEngine, VisionResult, VisionStats
+
+
+logger = logging.getLogger(__name__)
+
+VISION_TIMER = stage_timer("vision")
+
+
+class FrameStream:
+    def __init__(
+        self,
+        engine: VisionEngine,
+        executor: Executor,
+        stats: VisionStats,
+        max_fps: float,
+        track: Optional[FaceTrack] = None,
+    ) -> None:
+        self.engine = engine
+        self.executor = executor
+        self.stats = stats
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.track = track
+        self.latest: Optional[bytes] = None
+        self.ready = asyncio.Event()
+
+    def offer(self, frame: bytes) -> None:
+        self.stats.frames_received += 1
+        if self.latest is not None:
+            self.stats.frames_dropped += 1
+            FRAMES_DROPPED.inc()
+        self.latest = frame
+        self.ready.set()
+
+    def _analyze(self, frame: bytes) -> VisionResult:
+        with VISION_TIMER.time():
+            return self.engine.analyze(frame, self.track)
+
+    async def run(self, on_result: Callable[[VisionResult], None]) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            frame, self.latest = self.latest, None
+            if frame is None:
+                continue
+            started = time.monotonic()
+            try:
+                result = await loop.run_in_executor(self.executor, self._analyze, frame)
+            except Exception:
+                logger.exception("Vision analysis failed")
+                continue
+            self.stats.frames_analyzed += 1
+            FRAMES_ANALYZED.inc()
+            on_result(result)
+            remaining = self.min_interval - (time.monotonic() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
@@ -1,66 +1,204 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List
+from typing import Any, Callable, List, Optional, Tuple
 import os
+import threading
+import time
 
-from sentence_transformers import CrossEncoder
-from transformers import pipeline
+import numpy as np
+
+from .batching import MicroBatcher
+from .cache import SCORE_CODEC, LRUCache, cache_path, fingerprint
+from .config import settings
+from .inference import backend_spec, load_cross_encoder, model_key
+from .telemetry import stage_timer
+
+
+LLM_TIMER = stage_timer("llm")
+RERANK_TIMER = stage_timer("rerank")
+PRERANK_TIMER = stage_timer("prerank")
+
+Scorer = Callable[[List[str]], np.ndarray]
 
 
 @dataclass
 class GenerationConfig:
     enable_llm: bool = False
     llm_model: str = "distilgpt2"
+    llm_mode: str = "progressive"
+    llm_budget_ms: int = 800
+    llm_max_new_tokens: int = 40
     cross_encoder_model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 
+    @property
+    def progressive(self) -> bool:
+        return self.llm_mode == "progressive"
 
-class GeneratorEngine:
-    def __init__(self) -> None:
-        self.config = GenerationConfig(enable_llm=os.getenv("ENABLE_LLM", "0") == "1")
-        self.cross_encoder = CrossEncoder(self.config.cross_encoder_model)
-        self.text_generator = None
-        if self.config.enable_llm:
-            self.text_generator = pipeline("text-generation", model=self.config.llm_model)
-
-    def generate(self, context: str, stage: str, retrieved: List[str], sentiment: float) -> List[str]:
-        base = list(retrieved)
-        base.extend(self._template_candidates(stage))
-        if self.text_generator:
-            prompt = self._prompt(context, stage)
-            llm_out = self.text_generator(prompt, max_new_tokens=40, num_return_sequences=2)
-            for item in llm_out:
-                text = item["generated_text"].replace(prompt, "").strip()
-                if text:
-                    base.append(text)
-        filtered = self._filter_for_sentiment(base, sentiment)
-        return self._rank(context, filtered)
-
-    def _template_candidates(self, stage: str) -> List[str]:
-        if stage == "problem":
-            return [
-                "Can you walk me through a recent example?",
-                "How often does that happen in a typical week?",
-            ]
-        if stage == "awareness":
-            return [
-                "What impact does that have on your goals?",
-                "How does that affect your customers or team?",
-            ]
-        if stage == "solution":
-            return [
-                "What would success look like in three months?",
-                "Which outcomes matter most to you?",
-            ]
-        if stage == "closing":
-            return [
-                "What would be the right next step for you?",
-                "Who needs to be part of that decision?",
-            ]
+
+def generation_config() -> GenerationConfig:
+    return GenerationConfig(
+        enable_llm=os.getenv("ENABLE_LLM", "0") == "1",
+        llm_mode=os.getenv("LLM_MODE", "progressive"),
+        llm_budget_ms=int(os.getenv("LLM_BUDGET_MS", "800")),
+    )
+
+
+def template_candidates(stage: str) -> List[str]:
+    if stage == "problem":
+        return [
+            "Can you walk me through a recent example?",
+            "How often does that happen in a typical week?",
+        ]
+    if stage == "awareness":
+        return [
+            "What impact does that have on your goals?",
+            "How does that affect your customers or team?",
+        ]
+    if stage == "solution":
+        return [
+            "What would success look like in three months?",
+            "Which outcomes matter most to you?",
+        ]
+    if stage == "closing":
         return [
-            "What is most important for you to solve first?",
-            "Can you share a bit more about that?",
+            "What would be the right next step for you?",
+            "Who needs to be part of that decision?",
         ]
+    return [
+        "What is most important for you to solve first?",
+        "Can you share a bit more about that?",
+    ]
+
+
+NEGATIVE_SENTIMENT = -0.2
+
+
+def filter_for_sentiment(candidates: List[str], sentiment: float) -> List[str]:
+    if sentiment >= NEGATIVE_SENTIMENT:
+        return candidates
+    blocked_terms = {"next step", "decision", "approve", "timeline", "commit"}
+    filtered = []
+    for line in candidates:
+        lower = line.lower()
+        if any(term in lower for term in blocked_terms):
+            continue
+        filtered.append(line)
+    return filtered
+
+
+def shortlist(lines: List[str], scorer: Optional[Scorer], limit: int) -> List[str]:
+    if scorer is None or len(lines) < 2:
+        return lines
+    with PRERANK_TIMER.time():
+        scores = np.asarray(scorer(lines))
+    order = np.argsort(-scores, kind="stable")
+    if limit > 0:
+        order = order[:limit]
+    return [lines[i] for i in order]
+
+
+class LLMBudget:
+    def __init__(self, deadline: float, cancel: Optional[threading.Event] = None) -> None:
+        self.deadline = deadline
+        self.cancel = cancel
+        self.stopped = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.is_set()
+
+    def expired(self) -> bool:
+        return self.cancelled or time.monotonic() >= self.deadline
+
+    def __call__(self, input_ids: Any, scores: Any, **kwargs: Any) -> bool:
+        if self.expired():
+            self.stopped = True
+        return self.stopped
+
+
+def complete_sentence(text: str) -> str:
+    end = max(text.rfind("?"), text.rfind("."), text.rfind("!"))
+    return text[: end + 1] if end >= 0 else ""
+
+
+def load_text_generator(config: GenerationConfig) -> Any:
+    from transformers import pipeline
+
+    return pipeline("text-generation", model=config.llm_model)
+
+
+class GeneratorEngine:
+    def __init__(self, config: Optional[GenerationConfig] = None) -> None:
+        self.config = config or generation_config()
+        self.backend = backend_spec()
+        self.cross_encoder = load_cross_encoder(self.config.cross_encoder_model, self.backend)
+        self.batcher: MicroBatcher | None = None
+        if settings.batch_inference:
+            self.batcher = MicroBatcher(
+                "rerank", self._predict_batch, settings.batch_window_ms, settings.batch_max_size
+            )
+        self.score_cache = LRUCache(
+            "rerank_scores",
+            max_entries=settings.score_cache_entries,
+            max_bytes=settings.score_cache_mb * 1024 * 1024,
+            sizeof=lambda key, score: len(key[1]) + 64,
+            codec=SCORE_CODEC,
+        )
+        if settings.cache_dir:
+            self.score_cache.load(self._cache_path())
+        self.text_generator: Any = None
+
+    @property
+    def progressive_llm(self) -> bool:
+        return self.text_generator is not None and self.config.progressive
+
+    @property
+    def inline_llm(self) -> bool:
+        return self.text_generator is not None and not self.config.progressive
+
+    def generate(
+        self,
+        context: str,
+        stage: str,
+        retrieved: List[str],
+        sentiment: float,
+        extra: Optional[List[str]] = None,
+        llm: bool = True,
+        scorer: Optional[Scorer] = None,
+    ) -> List[str]:
+        base = list(retrieved)
+        base.extend(template_candidates(stage))
+        base.extend(extra or [])
+        if llm and self.inline_llm:
+            base.extend(self.generate_llm(context, stage))
+        filtered = filter_for_sentiment(base, sentiment)
+        with RERANK_TIMER.time():
+            return self._rank(context, filtered, scorer)
+
+    def generate_llm(self, context: str, stage: str, budget: Optional[LLMBudget] = None) -> List[str]:
+        if self.text_generator is None:
+            return []
+        kwargs = {}
+        if budget is not None:
+            if budget.expired():
+                return []
+            kwargs["stopping_criteria"] = [budget]
+        prompt = self._prompt(context, stage)
+        with LLM_TIMER.time():
+            llm_out = self.text_generator(
+                prompt, max_new_tokens=self.config.llm_max_new_tokens, num_return_sequences=2, **kwargs
+            )
+        if budget is not None and budget.cancelled:
+            return []
+        lines = []
+        for item in llm_out:
+            text = item["generated_text"].replace(prompt, "").strip()
+            if budget is not None and budget.stopped:
+                text = complete_sentence(text)
+            if text:
+                lines.append(text)
+        return lines
 
     def _prompt(self, context: str, stage: str) -> str:
         safe_context = context[-300:]
@@ -70,23 +208,39 @@ class GeneratorEngine:
             f"{stage}. Context: {safe_context}\nQuestion:"
         )
 
-    def _filter_for_sentiment(self, candidates: List[str], sentiment: float) -> List[str]:
-        if sentiment >= -0.2:
-            return candidates
-        blocked_terms = {"next step", "decision", "approve", "timeline", "commit"}
-        filtered = []
-        for line in candidates:
-            lower = line.lower()
-            if any(term in lower for term in blocked_terms):
-                continue
-            filtered.append(line)
-        return filtered
-
-    def _rank(self, context: str, candidates: List[str]) -> List[str]:
+    def _predict_batch(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        return self.cross_encoder.predict(pairs)
+
+    def predict(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        if self.batcher is None:
+            return self._predict_batch(pairs)
+        return np.asarray(self.batcher.run(pairs))
+
+    def _cache_path(self) -> str:
+        return cache_path(
+            settings.cache_dir,
+            "rerank_scores",
+            model_key(self.config.cross_encoder_model, self.backend),
+            SCORE_CODEC,
+        )
+
+    def save_cache(self) -> None:
+        if settings.cache_dir:
+            self.score_cache.save(self._cache_path())
+
+    def _rank(self, context: str, candidates: List[str], scorer: Optional[Scorer] = None) -> List[str]:
         unique = list(dict.fromkeys([c.strip() for c in candidates if c.strip()]))
         if not unique:
             return []
-        pairs = [(context, c) for c in unique]
-        scores = self.cross_encoder.predict(pairs)
+        if 0 < settings.rerank_shortlist < len(unique):
+            unique = shortlist(unique, scorer, settings.rerank_shortlist)
+        context_key = fingerprint(context)
+        scores = [self.score_cache.get((context_key, c)) for c in unique]
+        missing = [c for c, score in zip(unique, scores) if score is None]
+        if missing:
+            fresh = dict(zip(missing, self.predict([(context, c) for c in missing])))
+            for line, score in fresh.items():
+                self.score_cache.put((context_key, line), float(score))
+            scores = [fresh[c] if score is None else score for c, score in zip(unique, scores)]
         ranked = sorted(zip(scores, unique), key=lambda x: x[0], reverse=True)
         return [line for _, line in ranked]
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict
+import platform
+
+from .config import settings
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8", "openvino")
+
+
+def default_int8_file() -> str:
+    machine = platform.machine().lower()
+    if machine in {"arm64", "aarch64"}:
+        return "onnx/model_qint8_arm64.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+@dataclass
+class BackendSpec:
+    name: str
+    file_name: str = ""
+    threads: int = 0
+
+    @property
+    def runtime(self) -> str:
+        return "onnx" if self.name.startswith("onnx") else self.name
+
+    @property
+    def cache_tag(self) -> str:
+        return "" if self.name == "torch" else self.name
+
+    def model_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {}
+        if self.runtime == "onnx":
+            kwargs["file_name"] = self.file_name or (
+                default_int8_file() if self.name == "onnx-int8" else "onnx/model.onnx"
+            )
+            kwargs["provider"] = "CPUExecutionProvider"
+            if self.threads:
+                import onnxruntime
+
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1
+                kwargs["session_options"] = options
+        elif self.runtime == "openvino" and self.threads:
+            kwargs["ov_config"] = {"INFERENCE_NUM_THREADS": str(self.threads)}
+        return kwargs
+
+    def apply_threads(self) -> None:
+        if self.runtime == "torch" and self.threads:
+            import torch
+
+            torch.set_num_threads(self.threads)
+
+
+def backend_spec(name: str = "", file_name: str = "", threads: int = -1) -> BackendSpec:
+    name = name or settings.inference_backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return BackendSpec(
+        name=name,
+        file_name=file_name or settings.inference_model_file,
+        threads=settings.inference_threads if threads < 0 else threads,
+    )
+
+
+def model_key(model_name: str, spec: BackendSpec) -> str:
+    return f"{model_name}@{spec.cache_tag}" if spec.cache_tag else model_name
+
+
+def load_embedder(model_name: str, spec: BackendSpec) -> Any:
+    from sentence_transformers import SentenceTransformer
+
+    spec.apply_threads()
+    if spec.runtime == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    return SentenceTransformer(
+        model_name, device="cpu", backend=spec.runtime, model_kwargs=spec.model_kwargs()
+    )
+
+
+def load_cross_encoder(model_name: str, spec: BackendSpec) -> Any:
+    from sentence_transformers import CrossEncoder
+
+    spec.apply_threads()
+    if spec.runtime == "torch":
+        return CrossEncoder(model_name, device="cpu")
+    return CrossEncoder(
+        model_name, device="cpu", backend=spec.runtime, model_kwargs=spec.model_kwargs()
+    )
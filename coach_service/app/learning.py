@@ -1,7 +1,16 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from typing import Dict, List
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+
+STRATEGIES = ("mean", "ucb", "thompson")
+POSITIVE_OUTCOMES = {"meeting_booked", "follow_up"}
 
 
 @dataclass
@@ -16,29 +25,182 @@ class BanditArm:
         return self.wins / self.shown
 
 
-@dataclass
 class BanditState:
-    arms: Dict[str, BanditArm] = field(default_factory=dict)
-
-    def register_lines(self, lines: List[str]) -> None:
-        for line in lines:
-            if line not in self.arms:
-                self.arms[line] = BanditArm(line=line)
-            self.arms[line].shown += 1
-
-    def apply_outcome(self, lines: List[str], outcome: str) -> None:
-        reward = 1 if outcome in {"meeting_booked", "follow_up"} else 0
-        for line in lines:
-            if line not in self.arms:
-                self.arms[line] = BanditArm(line=line)
-            if reward == 1:
-                self.arms[line].wins += 1
+    def __init__(
+        self,
+        db_path: str = "",
+        strategy: str = "mean",
+        ucb_c: float = 1.0,
+        capacity: int = 1024,
+        seed: Optional[int] = None,
+    ) -> None:
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown bandit strategy: {strategy}")
+        self.db_path = db_path
+        self.strategy = strategy
+        self.ucb_c = ucb_c
+        self.index: Dict[str, int] = {}
+        self.lines: List[str] = []
+        self.shown = np.zeros(capacity, dtype=np.int64)
+        self.wins = np.zeros(capacity, dtype=np.int64)
+        self.total_shown = 0
+        self.pending: Dict[str, List[int]] = {}
+        self.synced_version = -1
+        self.flushes = 0
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng(seed)
+        if seed is None:
+            os.register_at_fork(after_in_child=self._reseed)
+        if db_path:
+            self.load()
+
+    def _reseed(self) -> None:
+        self.rng = np.random.default_rng()
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def _arm_id(self, line: str) -> int:
+        arm_id = self.index.get(line)
+        if arm_id is None:
+            arm_id = len(self.lines)
+            if arm_id == len(self.shown):
+                self.shown = np.concatenate([self.shown, np.zeros_like(self.shown)])
+                self.wins = np.concatenate([self.wins, np.zeros_like(self.wins)])
+            self.index[line] = arm_id
+            self.lines.append(line)
+        return arm_id
+
+    def _record(self, line: str, shown: int, wins: int) -> None:
+        arm_id = self._arm_id(line)
+        self.shown[arm_id] += shown
+        self.wins[arm_id] += wins
+        self.total_shown += shown
+        if self.db_path:
+            delta = self.pending.setdefault(line, [0, 0])
+            delta[0] += shown
+            delta[1] += wins
+
+    def arm(self, line: str) -> BanditArm:
+        with self.lock:
+            arm_id = self.index.get(line)
+            if arm_id is None:
+                return BanditArm(line=line)
+            return BanditArm(line=line, shown=int(self.shown[arm_id]), wins=int(self.wins[arm_id]))
+
+    def register_lines(self, lines: Iterable[str]) -> None:
+        with self.lock:
+            for line in lines:
+                self._record(line, 1, 0)
+
+    def apply_outcome(self, lines: Iterable[str], outcome: str) -> None:
+        reward = 1 if outcome in POSITIVE_OUTCOMES else 0
+        with self.lock:
+            for line in lines:
+                self._record(line, 0, reward)
+
+    def scores(self, lines: List[str]) -> np.ndarray:
+        with self.lock:
+            ids = np.fromiter((self.index.get(line, -1) for line in lines), dtype=np.int64, count=len(lines))
+            known = ids >= 0
+            shown = np.where(known, self.shown[np.maximum(ids, 0)], 0).astype(np.float64)
+            wins = np.where(known, self.wins[np.maximum(ids, 0)], 0).astype(np.float64)
+            total = self.total_shown
+        if self.strategy == "thompson":
+            return self.rng.beta(wins + 1.0, np.maximum(shown - wins, 0.0) + 1.0)
+        seen = shown > 0
+        mean = np.divide(wins, shown, out=np.full_like(shown, 0.5), where=seen)
+        if self.strategy == "ucb":
+            bonus = self.ucb_c * np.sqrt(np.log(max(total, 1) + 1.0) / np.maximum(shown, 1.0))
+            return np.where(seen, mean + bonus, np.inf)
+        return mean
 
     def rank(self, lines: List[str]) -> List[str]:
-        scored = []
-        for line in lines:
-            arm = self.arms.get(line)
-            score = arm.score() if arm else 0.5
-            scored.append((score, line))
-        scored.sort(reverse=True)
-        return [line for _, line in scored]
+        if not lines:
+            return []
+        order = np.argsort(-self.scores(lines), kind="stable")
+        return [lines[i] for i in order]
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS arms ("
+            "line TEXT PRIMARY KEY, shown INTEGER NOT NULL DEFAULT 0, wins INTEGER NOT NULL DEFAULT 0, "
+            "version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(arms)")}
+        if "version" not in columns:
+            conn.execute("ALTER TABLE arms ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute("CREATE INDEX IF NOT EXISTS arms_version ON arms (version)")
+        return conn
+
+    def load(self) -> int:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT line, shown, wins, version FROM arms WHERE version > ?", (self.synced_version,)
+            ).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return 0
+        with self.lock:
+            for line, shown, wins, _ in rows:
+                arm_id = self._arm_id(line)
+                delta = self.pending.get(line, (0, 0))
+                self.total_shown += shown + delta[0] - int(self.shown[arm_id])
+                self.shown[arm_id] = shown + delta[0]
+                self.wins[arm_id] = wins + delta[1]
+            self.synced_version = max(self.synced_version, max(row[3] for row in rows))
+        return len(rows)
+
+    def flush(self) -> int:
+        if not self.db_path:
+            return 0
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    (version,) = conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM arms").fetchone()
+                    conn.executemany(
+                        "INSERT INTO arms (line, shown, wins, version) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(line) DO UPDATE SET "
+                        "shown = shown + excluded.shown, wins = wins + excluded.wins, version = excluded.version",
+                        [(line, shown, wins, version) for line, (shown, wins) in pending.items()],
+                    )
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            with self.lock:
+                for line, (shown, wins) in pending.items():
+                    delta = self.pending.setdefault(line, [0, 0])
+                    delta[0] += shown
+                    delta[1] += wins
+            raise
+        self.flushes += 1
+        return len(pending)
+
+    def sync(self) -> int:
+        flushed = self.flush()
+        if self.db_path:
+            self.load()
+        return flushed
+
+    def stats(self) -> dict:
+        return {
+            "arms": len(self.lines),
+            "strategy": self.strategy,
+            "pending_writes": len(self.pending),
+            "flushes": self.flushes,
+        }
@@ -1,23 +1,33 @@
 from __future__ import annotations
 
 import asyncio
-import json
+import logging
 import os
 import time
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from .audio import AudioEvent, AudioStream
+from .broadcast import UIBroadcaster
 from .config import settings
-from .schemas import TranscriptMessage
-from .state import SharedState, create_state, update_metrics, update_vision
-from .vision import VisionEngine
+from .frames import FrameStream
+from .schemas import LiveMetrics, TranscriptBatch, TranscriptMessage
+from .pipeline import SuggestionPipeline
+from .sessions import SessionState, write_session
+from .state import SharedState, create_state, record_outcome, update_provisional, update_vision
+from .vision import FaceTrack, VisionEngine
 from .summary import build_summary
-from vosk import Model, KaldiRecognizer
+from .transcript import prune_transcripts, transcript_dir
+from . import cluster, telemetry, wire
 
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Coach Service", version="0.1.0")
 
 app.add_middleware(
@@ -29,134 +39,443 @@ app.add_middleware(
 )
 
 
-class ConnectionManager:
-    def __init__(self) -> None:
-        self.ui_clients: List[WebSocket] = []
+state: SharedState = create_state()
+broadcaster = UIBroadcaster(
+    state.sessions,
+    min_interval=settings.ui_min_push_interval_sec,
+    heartbeat_sec=settings.ui_heartbeat_sec,
+    max_queue=settings.ui_client_queue_size,
+    slow_client_policy=settings.ui_slow_client_policy,
+)
+pipeline = SuggestionPipeline(state, mode=settings.pipeline_mode, workers=settings.pipeline_workers)
+audio_executor = ThreadPoolExecutor(max_workers=settings.audio_workers, thread_name_prefix="audio")
+vision_executor = ThreadPoolExecutor(max_workers=settings.vision_workers, thread_name_prefix="vision")
 
-    async def connect_ui(self, websocket: WebSocket) -> None:
-        await websocket.accept()
-        self.ui_clients.append(websocket)
+telemetry.registry.gauge("coach_active_sessions", "Sessions held in the registry.", lambda: len(state.sessions))
+telemetry.registry.gauge("coach_ui_clients", "Connected /ws/ui clients.", broadcaster.client_count)
+telemetry.registry.gauge(
+    "coach_pipeline_in_flight", "Sessions with a suggestion run in progress.", lambda: len(pipeline.running)
+)
+telemetry.registry.gauge(
+    "coach_quality_tier",
+    "Current suggestion quality tier (0 full, 3 cached only), the worst across workers.",
+    lambda: pipeline.admission.level,
+    merge="max",
+)
 
-    def disconnect_ui(self, websocket: WebSocket) -> None:
-        if websocket in self.ui_clients:
-            self.ui_clients.remove(websocket)
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "")
+ENABLE_VISION = os.getenv("ENABLE_VISION", "1") == "1"
 
-    async def broadcast_metrics(self, payload: dict) -> None:
-        if not self.ui_clients:
-            return
-        data = json.dumps(payload)
-        for ws in list(self.ui_clients):
-            try:
-                await ws.send_text(data)
-            except WebSocketDisconnect:
-                self.disconnect_ui(ws)
 
+def load_vosk_model() -> Any:
+    from vosk import Model
 
-state: SharedState = create_state()
-manager = ConnectionManager()
-vision_engine = VisionEngine()
+    return Model(VOSK_MODEL_PATH)
 
-VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "")
-vosk_model = Model(VOSK_MODEL_PATH) if VOSK_MODEL_PATH else None
+
+state.models.add("vosk", load_vosk_model, warmup=AudioStream.warm_up, enabled=bool(VOSK_MODEL_PATH))
+state.models.add(
+    "vision",
+    lambda: VisionEngine(decode_scale=settings.vision_decode_scale),
+    warmup=lambda engine: engine.warm_up(),
+    enabled=ENABLE_VISION,
+)
+
+
+async def session_reaper() -> None:
+    while True:
+        await asyncio.sleep(settings.session_sweep_interval_sec)
+        state.sessions.evict_expired()
+
+
+async def bandit_writer() -> None:
+    while True:
+        await asyncio.sleep(settings.bandit_flush_interval_sec)
+        try:
+            await asyncio.to_thread(state.bandit.sync if cluster.worker.enabled else state.bandit.flush)
+        except Exception:
+            logger.exception("Bandit flush failed")
+
+
+def flush_transcripts() -> None:
+    for session in state.sessions.snapshot().values():
+        write_session(session)
 
 
-async def metrics_pusher() -> None:
+async def transcript_flusher() -> None:
     while True:
-        await manager.broadcast_metrics(state.last_metrics.model_dump())
-        await asyncio.sleep(settings.ui_push_interval_sec)
+        await asyncio.sleep(settings.transcript_flush_interval_sec)
+        try:
+            await asyncio.to_thread(flush_transcripts)
+        except Exception:
+            logger.exception("Transcript flush failed")
+
+
+async def transcript_pruner() -> None:
+    max_age_sec = settings.transcript_retention_hours * 3600
+    while True:
+        try:
+            removed = await asyncio.to_thread(prune_transcripts, transcript_dir(), max_age_sec)
+            if removed:
+                logger.info("Removed %d expired transcript files", removed)
+        except Exception:
+            logger.exception("Transcript pruning failed")
+        await asyncio.sleep(settings.transcript_prune_interval_sec)
+
+
+async def snapshot_writer() -> None:
+    while True:
+        await asyncio.sleep(settings.stats_snapshot_interval_sec)
+        try:
+            write_worker_snapshot()
+        except Exception:
+            logger.exception("Worker snapshot failed")
+
+
+def write_worker_snapshot() -> None:
+    cluster.write_snapshot({"metrics": telemetry.registry.snapshot(), "stats": local_stats()})
+
+
+def resolve_session(session_id: Optional[str]) -> SessionState:
+    if not session_id:
+        return state.sessions.get_or_create(settings.default_session_id)
+    session = state.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return session
 
 
 @app.on_event("startup")
 async def startup_event() -> None:
-    asyncio.create_task(metrics_pusher())
+    state.models.start()
+    asyncio.create_task(broadcaster.run())
+    asyncio.create_task(session_reaper())
+    if settings.bandit_db:
+        asyncio.create_task(bandit_writer())
+    if cluster.worker.enabled:
+        asyncio.create_task(snapshot_writer())
+    if settings.transcript_log:
+        asyncio.create_task(transcript_flusher())
+    if settings.transcript_log and settings.transcript_retention_hours > 0 and cluster.worker.worker_id <= 0:
+        asyncio.create_task(transcript_pruner())
+
+
+def save_model_caches() -> None:
+    if cluster.worker.worker_id > 0:
+        return
+    for engine in (state.retrieval, state.generator):
+        if engine is not None:
+            engine.save_cache()
+
+
+def run_shutdown_step(name: str, step: Callable[[], None]) -> None:
+    try:
+        step()
+    except Exception:
+        logger.exception("Shutdown step %s failed", name)
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    pipeline.shutdown()
+    audio_executor.shutdown(wait=False, cancel_futures=True)
+    vision_executor.shutdown(wait=False, cancel_futures=True)
+    run_shutdown_step("bandit flush", state.bandit.flush)
+    run_shutdown_step("session checkpoints", state.sessions.close)
+    run_shutdown_step("model caches", save_model_caches)
+    if cluster.worker.enabled:
+        run_shutdown_step("worker snapshot", write_worker_snapshot)
 
 
 @app.websocket("/ws/ui")
-async def ws_ui(websocket: WebSocket) -> None:
-    await manager.connect_ui(websocket)
+async def ws_ui(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    delta: bool = False,
+    fmt: str = Query("json", alias="format"),
+) -> None:
+    try:
+        client = await broadcaster.connect(websocket, session_id, delta, fmt)
+    except WebSocketDisconnect:
+        return
     try:
         while True:
-            message = await websocket.receive_text()
-            if message == "ping":
-                await websocket.send_text("pong")
+            frame = await wire.receive(websocket)
+            if wire.decode_control(frame, client.binary) == "ping":
+                broadcaster.send_control(client, "pong")
     except WebSocketDisconnect:
-        manager.disconnect_ui(websocket)
+        pass
+    finally:
+        broadcaster.disconnect(client)
 
 
 @app.websocket("/ws/ingest")
-async def ws_ingest(websocket: WebSocket) -> None:
-    await websocket.accept()
+async def ws_ingest(
+    websocket: WebSocket,
+    session_id: str = settings.default_session_id,
+    fmt: str = Query("json", alias="format"),
+    ack_every: int = settings.ingest_ack_every,
+) -> None:
     try:
+        binary = await wire.accept(websocket, fmt)
+        received = 0
         while True:
-            payload = await websocket.receive_text()
-            data = json.loads(payload)
-            msg = TranscriptMessage(**data)
-            update_metrics(state, msg)
-            await websocket.send_text(
-                json.dumps({"status": "ok", "received_ms": int(time.time() * 1000)})
-            )
+            frame = await wire.receive(websocket)
+            data = wire.decode_messages(frame, binary)
+            session = state.sessions.get_or_create(session_id)
+            if isinstance(data, list):
+                if not data or len(data) > settings.ingest_batch_max:
+                    detail = "Batch too large" if data else "Empty batch"
+                    await wire.send(websocket, {"status": "error", "detail": detail}, binary)
+                    continue
+                metrics = await pipeline.process_batch(session, data)
+                received += len(data)
+                ack = batch_ack(session, len(data), metrics)
+                if ack_every > 1:
+                    ack["acked"] = received
+                await wire.send(websocket, ack, binary)
+                continue
+            await pipeline.process(session, data)
+            received += 1
+            if ack_every > 1 and received % ack_every:
+                continue
+            ack = {
+                "status": "ok",
+                "received_ms": int(time.time() * 1000),
+                "ingested_ms": session.last_ingest_ms,
+            }
+            if ack_every > 1:
+                ack["acked"] = received
+            await wire.send(websocket, ack, binary)
     except WebSocketDisconnect:
         return
 
 
 @app.websocket("/ws/audio")
-async def ws_audio(websocket: WebSocket) -> None:
+async def ws_audio(
+    websocket: WebSocket,
+    session_id: str = settings.default_session_id,
+    ack_every: int = settings.audio_ack_every,
+) -> None:
     await websocket.accept()
-    if vosk_model is None:
+    if not state.models.enabled("vosk"):
         await websocket.send_text("error:Vosk model not configured")
         await websocket.close()
         return
-    recognizer = KaldiRecognizer(vosk_model, 16000)
+
+    async def on_event(event: AudioEvent) -> None:
+        session = state.sessions.get_or_create(session_id)
+        if not event.final:
+            update_provisional(state, session, event.text)
+        elif event.text:
+            msg = TranscriptMessage(speaker="rep", text=event.text, timestamp_ms=int(time.time() * 1000))
+            await pipeline.process(session, msg, min_interval=settings.audio_final_min_interval_sec)
+        else:
+            update_provisional(state, session, "")
+
+    stream: Optional[AudioStream] = None
+    decoder: Optional[asyncio.Task] = None
+    received = 0
     try:
         while True:
             data = await websocket.receive_bytes()
-            if recognizer.AcceptWaveform(data):
-                result = json.loads(recognizer.Result())
-                text = result.get("text", "").strip()
-                if text:
-                    msg = TranscriptMessage(
-                        speaker="rep",
-                        text=text,
-                        timestamp_ms=int(time.time() * 1000),
-                    )
-                    update_metrics(state, msg)
-            else:
-                partial = json.loads(recognizer.PartialResult()).get("partial", "").strip()
-                if partial:
-                    msg = TranscriptMessage(
-                        speaker="rep",
-                        text=partial,
-                        timestamp_ms=int(time.time() * 1000),
-                    )
-                    update_metrics(state, msg)
-            await websocket.send_text("ok")
+            received += 1
+            if stream is None:
+                model = state.models.get("vosk")
+                if model is None:
+                    if state.models.slots["vosk"].status == "failed":
+                        await websocket.send_text("error:Vosk model failed to load")
+                        await websocket.close()
+                        return
+                    continue
+                stream = AudioStream(
+                    model,
+                    audio_executor,
+                    state.sessions.get_or_create(session_id).audio_stats,
+                    max_pending_bytes=settings.audio_max_pending_bytes,
+                    max_decode_bytes=settings.audio_max_decode_bytes,
+                )
+                decoder = asyncio.create_task(stream.run(on_event))
+            if decoder is not None and decoder.done():
+                if not decoder.cancelled() and decoder.exception() is not None:
+                    logger.error("Audio decoder stopped", exc_info=decoder.exception())
+                await websocket.send_text("error:Audio decoder stopped")
+                await websocket.close()
+                return
+            await stream.offer(data)
+            if ack_every > 0 and received % ack_every == 0:
+                await websocket.send_text("ok")
     except WebSocketDisconnect:
         return
+    finally:
+        if decoder is not None:
+            decoder.cancel()
 
 
 @app.websocket("/ws/vision")
-async def ws_vision(websocket: WebSocket) -> None:
+async def ws_vision(websocket: WebSocket, session_id: str = settings.default_session_id) -> None:
     await websocket.accept()
+    if not state.models.enabled("vision"):
+        await websocket.send_text("error:Vision disabled")
+        await websocket.close()
+        return
+    session = state.sessions.get_or_create(session_id)
+    track = None
+    if settings.vision_tracking:
+        track = FaceTrack(
+            detect_interval=settings.vision_detect_interval,
+            min_match_score=settings.vision_track_min_score,
+            smoothing=settings.vision_gaze_smoothing,
+        )
+    stream: Optional[FrameStream] = None
+    analyzer: Optional[asyncio.Task] = None
     try:
         while True:
             frame = await websocket.receive_bytes()
-            result = vision_engine.analyze(frame)
-            update_vision(state, result)
+            if stream is None:
+                engine = state.models.get("vision")
+                if engine is None and state.models.slots["vision"].status == "failed":
+                    await websocket.send_text("error:Vision model failed to load")
+                    await websocket.close()
+                    return
+                if engine is not None:
+                    stream = FrameStream(engine, vision_executor, session.vision_stats, settings.vision_max_fps, track)
+                    analyzer = asyncio.create_task(
+                        stream.run(
+                            lambda result: update_vision(state, state.sessions.get_or_create(session_id), result)
+                        )
+                    )
+            if stream is not None:
+                stream.offer(frame)
             await websocket.send_text("ok")
     except WebSocketDisconnect:
         return
+    finally:
+        if analyzer is not None:
+            analyzer.cancel()
+
+
+def batch_ack(session: SessionState, count: int, metrics: LiveMetrics) -> dict:
+    return {
+        "status": "ok",
+        "received_ms": int(time.time() * 1000),
+        "ingested_ms": session.last_ingest_ms,
+        "count": count,
+        "metrics": metrics.model_dump(),
+    }
+
+
+@app.post("/ingest/batch")
+async def post_ingest_batch(batch: TranscriptBatch, session_id: Optional[str] = None) -> dict:
+    if len(batch.messages) > settings.ingest_batch_max:
+        raise HTTPException(status_code=413, detail="Batch too large")
+    if not batch.messages:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    session = state.sessions.get_or_create(session_id or batch.session_id or settings.default_session_id)
+    metrics = await pipeline.process_batch(session, batch.messages)
+    return batch_ack(session, len(batch.messages), metrics)
 
 
 @app.post("/outcome")
-async def post_outcome(payload: dict) -> dict:
+async def post_outcome(payload: dict, session_id: Optional[str] = None) -> dict:
     outcome = payload.get("outcome")
     if outcome not in {"meeting_booked", "follow_up", "lost"}:
         raise HTTPException(status_code=400, detail="Invalid outcome")
-    state.bandit.apply_outcome(state.last_suggestions, outcome)
+    session = resolve_session(session_id or payload.get("session_id"))
+    credited = record_outcome(state, session, outcome)
+    return {"status": "ok", "credited_lines": credited}
+
+
+def batching_stats() -> dict:
+    stats = {}
+    for engine in (state.retrieval, state.generator):
+        batcher = engine.batcher if engine is not None else None
+        if batcher is not None:
+            stats[batcher.name] = batcher.stats.as_dict(batcher.max_batch)
+    return stats
+
+
+def audio_stats() -> dict:
+    totals = {"chunks_received": 0, "chunks_decoded": 0, "chunks_coalesced": 0, "backpressure_waits": 0}
+    for session in state.sessions.snapshot().values():
+        for key in totals:
+            totals[key] += getattr(session.audio_stats, key)
+    return totals
+
+
+def vision_stats() -> dict:
+    totals = {"frames_received": 0, "frames_analyzed": 0, "frames_dropped": 0}
+    for session in state.sessions.snapshot().values():
+        stats = session.vision_stats
+        totals["frames_received"] += stats.frames_received
+        totals["frames_analyzed"] += stats.frames_analyzed
+        totals["frames_dropped"] += stats.frames_dropped
+    return totals
+
+
+def cache_stats() -> dict:
+    stats = {}
+    if state.retrieval is not None:
+        stats["embeddings"] = state.retrieval.embedding_cache.stats()
+    if state.generator is not None:
+        stats["rerank_scores"] = state.generator.score_cache.stats()
+    stats["suggestions"] = state.suggestion_cache.stats()
+    return stats
+
+
+@app.get("/healthz")
+async def get_healthz() -> dict:
     return {"status": "ok"}
 
 
+@app.get("/readyz")
+async def get_readyz() -> JSONResponse:
+    ready = state.models.is_ready()
+    body = {"status": "ready" if ready else "loading", "models": state.models.status()}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+def local_stats() -> dict:
+    return {
+        "sessions": {"active": len(state.sessions), "evicted": state.sessions.evicted},
+        "audio": audio_stats(),
+        "vision": vision_stats(),
+        "pipeline": pipeline.stats(),
+        "ui": broadcaster.stats(),
+        "batching": batching_stats(),
+        "caches": cache_stats(),
+        "bandit": state.bandit.stats(),
+        "models": state.models.status(),
+        "inference_backend": settings.inference_backend,
+    }
+
+
+def peer_snapshots() -> dict:
+    return cluster.read_snapshots(max_age_sec=settings.stats_snapshot_interval_sec * 5)
+
+
+@app.get("/stats")
+async def get_stats() -> dict:
+    stats = local_stats()
+    if cluster.worker.enabled:
+        stats["worker"] = cluster.worker.worker_id
+        stats["peers"] = {str(worker_id): snap["stats"] for worker_id, snap in peer_snapshots().items()}
+    return stats
+
+
+@app.get("/metrics")
+async def get_metrics() -> PlainTextResponse:
+    if cluster.worker.enabled:
+        snapshots = [telemetry.registry.snapshot()]
+        snapshots.extend(snap["metrics"] for snap in peer_snapshots().values())
+        body = telemetry.render_snapshot(telemetry.merge_snapshots(snapshots))
+    else:
+        body = telemetry.registry.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 @app.get("/summary")
-async def get_summary() -> dict:
-    summary = build_summary(state.perception, state.last_metrics)
-    return {"summary": summary}
+async def get_summary(session_id: Optional[str] = None) -> dict:
+    session = resolve_session(session_id)
+    summary = build_summary(session.perception, session.last_metrics, session.summary, session.transcript)
+    return {"summary": summary, "details": session.summary.as_dict()}
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class ModelSlot:
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        warmup: Optional[Callable[[Any], None]] = None,
+        on_ready: Optional[Callable[[Any], None]] = None,
+        enabled: bool = True,
+    ) -> None:
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.on_ready = on_ready
+        self.enabled = enabled
+        self.status = "pending" if enabled else "disabled"
+        self.error = ""
+        self.value: Any = None
+        self.load_seconds = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def load(self) -> None:
+        if self.status != "pending":
+            return
+        self.status = "loading"
+        started = time.perf_counter()
+        try:
+            value = self.loader()
+            if self.warmup is not None:
+                self.warmup(value)
+            if self.on_ready is not None:
+                self.on_ready(value)
+        except Exception as exc:
+            logger.exception("Failed to load model %s", self.name)
+            self.status = "failed"
+            self.error = f"{type(exc).__name__}: {exc}"
+            return
+        finally:
+            self.load_seconds = time.perf_counter() - started
+        self.value = value
+        self.status = "ready"
+        logger.info("Loaded model %s in %.1fs", self.name, self.load_seconds)
+
+    def describe(self) -> dict:
+        info = {"status": self.status, "load_seconds": round(self.load_seconds, 3)}
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+class ModelRegistry:
+    def __init__(self) -> None:
+        self.slots: Dict[str, ModelSlot] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.version = 0
+
+    def add(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        warmup: Optional[Callable[[Any], None]] = None,
+        on_ready: Optional[Callable[[Any], None]] = None,
+        enabled: bool = True,
+    ) -> ModelSlot:
+        slot = ModelSlot(name, loader, warmup=warmup, on_ready=on_ready, enabled=enabled)
+        self.slots[name] = slot
+        return slot
+
+    def get(self, name: str) -> Any:
+        slot = self.slots.get(name)
+        if slot is None or not slot.ready:
+            return None
+        return slot.value
+
+    def enabled(self, name: str) -> bool:
+        slot = self.slots.get(name)
+        return slot is not None and slot.enabled
+
+    def load_all(self) -> None:
+        for slot in list(self.slots.values()):
+            if slot.status == "pending":
+                slot.load()
+                self.version += 1
+
+    def start(self) -> None:
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.load_all, name="model-loader", daemon=True)
+        self.thread.start()
+
+    def is_ready(self) -> bool:
+        return all(slot.ready for slot in self.slots.values() if slot.enabled)
+
+    def pending(self) -> List[str]:
+        return [slot.name for slot in self.slots.values() if slot.enabled and not slot.ready]
+
+    def status(self) -> dict:
+        return {name: slot.describe() for name, slot in self.slots.items()}
@@ -2,7 +2,9 @@ from __future__ import annotations
 
 from collections import deque
 from dataclasses import dataclass
-from typing import Deque, List
+from itertools import islice
+from typing import Deque, Dict, List, Optional
+import re
 import time
 
 from .schemas import TranscriptMessage
@@ -44,9 +46,30 @@ STAGE_KEYWORDS = {
 }
 
 
+RECENT_WINDOW = 6
+
+
+def _compile_stage_matcher(keywords: Dict[str, set]) -> re.Pattern:
+    branches = []
+    for stage, words in keywords.items():
+        alternatives = "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+        branches.append(f"(?P<{stage}>{alternatives})")
+    return re.compile("(?=" + "|".join(branches) + ")")
+
+
+COUNTERS = ("rep_word_count", "prospect_word_count", "rep_questions", "start_time_ms")
+STAGE_ORDER = list(STAGE_KEYWORDS)
+STAGE_MATCHER = _compile_stage_matcher(STAGE_KEYWORDS)
+
+
 @dataclass
 class PerceptionState:
     history: Deque[TranscriptMessage]
+    scores: Deque[float]
+    recent: Deque[TranscriptMessage]
+    recent_lower: Deque[str]
+    sentiment_total: float = 0.0
+    stage: Optional[str] = None
     rep_word_count: int = 0
     prospect_word_count: int = 0
     rep_questions: int = 0
@@ -55,12 +78,27 @@ class PerceptionState:
 
 class PerceptionEngine:
     def __init__(self, max_history: int) -> None:
-        self.state = PerceptionState(history=deque(maxlen=max_history))
-
-    def ingest(self, message: TranscriptMessage) -> None:
-        if self.state.start_time_ms == 0:
-            self.state.start_time_ms = message.timestamp_ms
-        self.state.history.append(message)
+        window = min(RECENT_WINDOW, max_history)
+        self.state = PerceptionState(
+            history=deque(maxlen=max_history),
+            scores=deque(maxlen=max_history),
+            recent=deque(maxlen=window),
+            recent_lower=deque(maxlen=window),
+        )
+
+    def ingest(self, message: TranscriptMessage) -> float:
+        state = self.state
+        if state.start_time_ms == 0:
+            state.start_time_ms = message.timestamp_ms
+        if state.scores.maxlen is not None and len(state.scores) == state.scores.maxlen:
+            state.sentiment_total -= state.scores[0]
+        score = self._sentiment_score(message.text)
+        state.scores.append(score)
+        state.sentiment_total += score
+        state.history.append(message)
+        state.recent.append(message)
+        state.recent_lower.append(message.text.lower())
+        state.stage = None
 
         word_count = len(message.text.split())
         if message.speaker == "rep":
@@ -69,6 +107,14 @@ class PerceptionEngine:
                 self.state.rep_questions += message.text.count("?")
         else:
             self.state.prospect_word_count += word_count
+        return score
+
+    def counters(self) -> Dict[str, int]:
+        return {name: getattr(self.state, name) for name in COUNTERS}
+
+    def restore_counters(self, counters: Dict[str, int]) -> None:
+        for name in COUNTERS:
+            setattr(self.state, name, int(counters[name]))
 
     def _sentiment_score(self, text: str) -> float:
         tokens = [t.strip(".,!?;:").lower() for t in text.split()]
@@ -79,10 +125,10 @@ class PerceptionEngine:
         return (pos - neg) / max(pos + neg, 1)
 
     def sentiment(self) -> float:
-        if not self.state.history:
+        count = len(self.state.scores)
+        if count == 0:
             return 0.0
-        scores = [self._sentiment_score(m.text) for m in self.state.history]
-        return sum(scores) / max(len(scores), 1)
+        return self.state.sentiment_total / count
 
     def talk_listen_ratio(self) -> float:
         rep = self.state.rep_word_count
@@ -112,15 +158,23 @@ class PerceptionEngine:
         return max(0.0, min(1.0, score))
 
     def stage(self) -> str:
-        text = " ".join(m.text.lower() for m in list(self.state.history)[-6:])
-        for stage, keywords in STAGE_KEYWORDS.items():
-            for kw in keywords:
-                if kw in text:
-                    return stage
+        if self.state.stage is None:
+            self.state.stage = self._match_stage(" ".join(self.state.recent_lower))
+        return self.state.stage
+
+    def _match_stage(self, text: str) -> str:
+        found = set()
+        for match in STAGE_MATCHER.finditer(text):
+            if match.lastgroup == STAGE_ORDER[0]:
+                return STAGE_ORDER[0]
+            found.add(match.lastgroup)
+        for stage in STAGE_ORDER:
+            if stage in found:
+                return stage
         return "connect"
 
     def recent_context(self) -> List[str]:
-        return [m.text for m in list(self.state.history)[-6:]]
+        return [m.text for m in self.state.recent]
 
     def recent_messages(self, limit: int = 12) -> List[TranscriptMessage]:
-        return list(self.state.history)[-limit:]
+        return list(islice(reversed(self.state.history), limit))[::-1]
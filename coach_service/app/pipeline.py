@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import threading
+import time
+
+from .admission import CACHED_ONLY, FULL, create_admission
+from .config import settings
+from .generation import LLMBudget
+from .schemas import LiveMetrics, TranscriptMessage
+from .sessions import SessionState
+from .state import (
+    SharedState,
+    SuggestionInput,
+    apply_suggestions,
+    compute_llm_upgrade,
+    cached_suggestions,
+    compute_suggestions,
+    ingest_message,
+    ingest_messages,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class SuggestionPipeline:
+    def __init__(self, state: SharedState, mode: str, workers: int) -> None:
+        if mode not in {"inline", "thread"}:
+            raise ValueError(f"Unknown pipeline mode: {mode}")
+        self.state = state
+        self.mode = mode
+        self.executor: Optional[ThreadPoolExecutor] = None
+        if mode == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="suggest")
+        self.pending: Dict[str, Tuple[SessionState, SuggestionInput]] = {}
+        self.running: Dict[str, asyncio.Task] = {}
+        self.min_intervals: Dict[str, float] = {}
+        self.trailing: Dict[str, asyncio.TimerHandle] = {}
+        self.llm_executor = ThreadPoolExecutor(max_workers=settings.llm_workers, thread_name_prefix="llm")
+        self.upgrades: Dict[str, Tuple[threading.Event, asyncio.Task]] = {}
+        self.admission = create_admission(workers)
+        self.queued = 0
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.upgrades_applied = 0
+        self.upgrades_cancelled = 0
+
+    async def process(
+        self, session: SessionState, message: TranscriptMessage, min_interval: float = 0.0
+    ) -> LiveMetrics:
+        if self.executor is None:
+            session_id = session.session_id
+            self._cancel_upgrade(session_id)
+            now = time.monotonic()
+            if now - session.last_suggested < min_interval:
+                if session_id in self.pending:
+                    self.coalesced += 1
+                self.pending[session_id] = (session, ingest_message(self.state, session, message))
+                self._schedule_trailing(session_id, session.last_suggested + min_interval - now)
+                return session.last_metrics
+            self._cancel_trailing(session_id)
+            if self.pending.pop(session_id, None) is not None:
+                self.coalesced += 1
+            session.last_suggested = now
+            inputs = ingest_message(self.state, session, message)
+            say_next, tier = await self._suggest(inputs)
+            metrics = apply_suggestions(self.state, session, say_next, inputs.as_of_ms, tier)
+            self._start_upgrade(session, inputs)
+            return metrics
+        inputs = ingest_message(self.state, session, message)
+        self.submit(session, inputs, min_interval)
+        return session.last_metrics
+
+    async def process_batch(self, session: SessionState, messages: List[TranscriptMessage]) -> LiveMetrics:
+        session_id = session.session_id
+        self._cancel_upgrade(session_id)
+        self._cancel_trailing(session_id)
+        if self.pending.pop(session_id, None) is not None:
+            self.coalesced += 1
+        inputs = ingest_messages(self.state, session, messages)
+        say_next, tier = await self._suggest(inputs)
+        session.last_suggested = time.monotonic()
+        metrics = apply_suggestions(self.state, session, say_next, inputs.as_of_ms, tier)
+        self.completed += 1
+        self._start_upgrade(session, inputs)
+        return metrics
+
+    def submit(self, session: SessionState, inputs: SuggestionInput, min_interval: float = 0.0) -> None:
+        session_id = session.session_id
+        self.submitted += 1
+        self._cancel_upgrade(session_id)
+        self.min_intervals[session_id] = min_interval
+        if session_id in self.pending:
+            self.coalesced += 1
+        self.pending[session_id] = (session, inputs)
+        if session_id not in self.running:
+            self.running[session_id] = asyncio.create_task(self._drain(session_id))
+
+    def _schedule_trailing(self, session_id: str, delay: float) -> None:
+        if session_id not in self.trailing:
+            loop = asyncio.get_running_loop()
+            self.trailing[session_id] = loop.call_later(max(0.0, delay), self._start_trailing, session_id)
+
+    def _cancel_trailing(self, session_id: str) -> None:
+        handle = self.trailing.pop(session_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _start_trailing(self, session_id: str) -> None:
+        self.trailing.pop(session_id, None)
+        if session_id in self.pending and session_id not in self.running:
+            self.running[session_id] = asyncio.create_task(self._run_trailing(session_id))
+
+    async def _run_trailing(self, session_id: str) -> None:
+        try:
+            entry = self.pending.pop(session_id, None)
+            if entry is None:
+                return
+            session, inputs = entry
+            session.last_suggested = time.monotonic()
+            try:
+                say_next, tier = await self._suggest(inputs)
+            except Exception:
+                logger.exception("Suggestion pipeline failed for session %s", session_id)
+                return
+            apply_suggestions(self.state, session, say_next, inputs.as_of_ms, tier)
+            self.completed += 1
+            self._start_upgrade(session, inputs)
+        finally:
+            self.running.pop(session_id, None)
+
+    async def _suggest(self, inputs: SuggestionInput) -> Tuple[List[str], int]:
+        tier = self.admission.admit(self.queued)
+        say_next = cached_suggestions(self.state, inputs)
+        if say_next is not None:
+            return say_next, FULL
+        started = time.monotonic()
+        if self.executor is None or tier >= CACHED_ONLY:
+            say_next = compute_suggestions(self.state, inputs, None, False, tier)
+        else:
+            loop = asyncio.get_running_loop()
+            self.queued += 1
+            try:
+                say_next = await loop.run_in_executor(
+                    self.executor, compute_suggestions, self.state, inputs, None, False, tier
+                )
+            finally:
+                self.queued -= 1
+        self.admission.observe(time.monotonic() - started)
+        return say_next, tier
+
+    async def _drain(self, session_id: str) -> None:
+        try:
+            while session_id in self.pending:
+                session, inputs = self.pending.pop(session_id)
+                started = time.monotonic()
+                try:
+                    say_next, tier = await self._suggest(inputs)
+                except Exception:
+                    logger.exception("Suggestion pipeline failed for session %s", session_id)
+                    continue
+                apply_suggestions(self.state, session, say_next, inputs.as_of_ms, tier)
+                self.completed += 1
+                if session_id not in self.pending:
+                    self._start_upgrade(session, inputs)
+                remaining = self.min_intervals.get(session_id, 0.0) - (time.monotonic() - started)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+        finally:
+            self.running.pop(session_id, None)
+            self.min_intervals.pop(session_id, None)
+
+    def _start_upgrade(self, session: SessionState, inputs: SuggestionInput) -> None:
+        generator = self.state.generator
+        if generator is None or not generator.progressive_llm or self.admission.level > FULL:
+            return
+        self._cancel_upgrade(session.session_id)
+        cancel = threading.Event()
+        budget = LLMBudget(time.monotonic() + generator.config.llm_budget_ms / 1000, cancel)
+        task = asyncio.create_task(self._upgrade(session, inputs, budget))
+        self.upgrades[session.session_id] = (cancel, task)
+
+    def _cancel_upgrade(self, session_id: str) -> None:
+        current = self.upgrades.pop(session_id, None)
+        if current is not None:
+            current[0].set()
+            self.upgrades_cancelled += 1
+
+    async def _upgrade(self, session: SessionState, inputs: SuggestionInput, budget: LLMBudget) -> None:
+        loop = asyncio.get_running_loop()
+        session_id = session.session_id
+        try:
+            say_next = await loop.run_in_executor(
+                self.llm_executor, compute_llm_upgrade, self.state, inputs, budget
+            )
+        except Exception:
+            logger.exception("LLM upgrade failed for session %s", session_id)
+            return
+        finally:
+            current = self.upgrades.get(session_id)
+            if current is not None and current[0] is budget.cancel:
+                self.upgrades.pop(session_id)
+        if say_next is None or budget.cancelled or session.last_metrics.say_next_ms != inputs.as_of_ms:
+            return
+        if say_next != session.last_suggestions:
+            apply_suggestions(self.state, session, say_next, inputs.as_of_ms)
+            self.upgrades_applied += 1
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "in_flight": len(self.running),
+            "llm_upgrades_in_flight": len(self.upgrades),
+            "llm_upgrades_applied": self.upgrades_applied,
+            "llm_upgrades_cancelled": self.upgrades_cancelled,
+            "admission": self.admission.stats(),
+        }
+
+    def shutdown(self) -> None:
+        for handle in self.trailing.values():
+            handle.cancel()
+        for task in self.running.values():
+            task.cancel()
+        for cancel, task in self.upgrades.values():
+            cancel.set()
+            task.cancel()
+        self.llm_executor.shutdown(wait=False, cancel_futures=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import csv
+import json
+import logging
+import os
+
+import faiss
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 2
+INDEX_TYPES = {"flat", "ivf", "hnsw"}
+
+
+@dataclass
+class RetrievalItem:
+    line: str
+    stage: str
+    tags: List[str]
+
+
+def _parse_tags(raw: object) -> List[str]:
+    if raw is None:
+        return []
+    if isinstance(raw, str):
+        return [t.strip() for t in raw.split("|") if t.strip()]
+    return [str(t).strip() for t in raw if str(t).strip()]
+
+
+def load_corpus(path: str) -> List[RetrievalItem]:
+    items: List[RetrievalItem] = []
+    with open(path, "r", encoding="utf-8", newline="") as handle:
+        if path.lower().endswith(".csv"):
+            rows: Iterable[dict] = csv.DictReader(handle)
+        else:
+            rows = (json.loads(raw) for raw in handle if raw.strip())
+        for row in rows:
+            line = (row.get("line") or "").strip()
+            if not line:
+                continue
+            items.append(
+                RetrievalItem(
+                    line=line,
+                    stage=(row.get("stage") or "connect").strip(),
+                    tags=_parse_tags(row.get("tags")),
+                )
+            )
+    return items
+
+
+def build_index(
+    embeddings: np.ndarray,
+    index_type: str,
+    nlist: int = 1024,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+) -> faiss.Index:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+    dim = vectors.shape[1]
+    if index_type == "ivf":
+        nlist = max(1, min(nlist, len(vectors)))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        index = faiss.IndexFlatIP(dim)
+    index.add(vectors)
+    return index
+
+
+class Playbook:
+    def __init__(
+        self,
+        lines: np.ndarray,
+        line_offsets: np.ndarray,
+        stage_ids: np.ndarray,
+        stage_names: List[str],
+        tag_offsets: np.ndarray,
+        tag_ids: np.ndarray,
+        tag_names: List[str],
+        embeddings: np.ndarray,
+        index: faiss.Index,
+        exact_scan_max: int = 20000,
+    ) -> None:
+        self.lines = lines
+        self.line_offsets = line_offsets
+        self.stage_ids = stage_ids
+        self.stage_names = stage_names
+        self.tag_offsets = tag_offsets
+        self.tag_ids = tag_ids
+        self.tag_names = tag_names
+        self.embeddings = embeddings
+        self.index = index
+        self.exact_scan_max = exact_scan_max
+        self.nprobe = 0
+        self.ef_search = 0
+        self.stage_ranges = _stage_ranges(stage_ids, stage_names)
+        self.tag_items: Optional[Dict[str, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.stage_ids)
+
+    def line(self, idx: int) -> str:
+        start, end = self.line_offsets[idx], self.line_offsets[idx + 1]
+        return bytes(self.lines[start:end]).decode("utf-8")
+
+    def item(self, idx: int) -> RetrievalItem:
+        tag_start, tag_end = self.tag_offsets[idx], self.tag_offsets[idx + 1]
+        return RetrievalItem(
+            line=self.line(idx),
+            stage=self.stage_names[self.stage_ids[idx]],
+            tags=[self.tag_names[t] for t in self.tag_ids[tag_start:tag_end]],
+        )
+
+    def vectors(self, ids: Sequence[int]) -> np.ndarray:
+        return np.asarray(self.embeddings[list(ids)], dtype=np.float32)
+
+    def configure(self, nprobe: int, ef_search: int, exact_scan_max: Optional[int] = None) -> None:
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        if exact_scan_max is not None:
+            self.exact_scan_max = exact_scan_max
+        ivf = faiss.try_extract_index_ivf(self.index)
+        if ivf is not None:
+            ivf.nprobe = nprobe
+        if hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = ef_search
+
+    def has_stage(self, stage: str) -> bool:
+        return stage in self.stage_ranges
+
+    def search(
+        self,
+        query_vec: np.ndarray,
+        top_k: int,
+        stage: Optional[str] = None,
+        tags: Optional[Sequence[str]] = None,
+    ) -> List[int]:
+        query = np.ascontiguousarray(query_vec, dtype=np.float32).reshape(1, -1)
+        if stage is None and not tags:
+            _, indices = self.index.search(query, top_k)
+            return [int(i) for i in indices[0] if i >= 0]
+        start, end = self.stage_ranges.get(stage, (0, len(self))) if stage is not None else (0, len(self))
+        ids = self._tagged_ids(tags, start, end) if tags else None
+        size = (end - start) if ids is None else len(ids)
+        if size == 0:
+            return []
+        if size <= self.exact_scan_max:
+            return self._exact_search(query[0], top_k, start, end, ids)
+        if ids is None:
+            selector = faiss.IDSelectorRange(start, end)
+        else:
+            selector = faiss.IDSelectorBatch(ids)
+        _, indices = self.index.search(query, top_k, params=self._search_params(selector))
+        return [int(i) for i in indices[0] if i >= 0]
+
+    def _exact_search(
+        self, query: np.ndarray, top_k: int, start: int, end: int, ids: Optional[np.ndarray]
+    ) -> List[int]:
+        if ids is None:
+            candidates = np.arange(start, end)
+            scores = self.embeddings[start:end] @ query
+        else:
+            candidates = ids
+            scores = self.embeddings[ids] @ query
+        if len(scores) > top_k:
+            top = np.argpartition(-scores, top_k)[:top_k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [int(candidates[i]) for i in top]
+
+    def _search_params(self, selector: faiss.IDSelector) -> faiss.SearchParameters:
+        if faiss.try_extract_index_ivf(self.index) is not None:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe or 1)
+        if hasattr(self.index, "hnsw"):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search or 16)
+        return faiss.SearchParameters(sel=selector)
+
+    def _tagged_ids(self, tags: Sequence[str], start: int, end: int) -> np.ndarray:
+        if self.tag_items is None:
+            owners = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.tag_offsets))
+            tag_ids = np.asarray(self.tag_ids)
+            self.tag_items = {
+                name: np.unique(owners[tag_ids == tag_id]) for tag_id, name in enumerate(self.tag_names)
+            }
+        matched = [self.tag_items[t] for t in tags if t in self.tag_items]
+        if not matched:
+            return np.empty(0, dtype=np.int64)
+        ids = np.unique(np.concatenate(matched))
+        return ids[np.searchsorted(ids, start):np.searchsorted(ids, end)]
+
+    @classmethod
+    def from_items(cls, items: Sequence[RetrievalItem], embeddings: np.ndarray, index_type: str = "flat") -> "Playbook":
+        items, embeddings = _sort_by_stage(items, embeddings)
+        arrays = _encode_metadata(items)
+        return cls(embeddings=embeddings, index=build_index(embeddings, index_type), **arrays)
+
+    @classmethod
+    def open(cls, directory: str, model_name: str) -> "Playbook":
+        with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported playbook version in {directory}")
+        if manifest["model_name"] != model_name:
+            raise ValueError(
+                f"Playbook {directory} was built with {manifest['model_name']}, expected {model_name}"
+            )
+
+        def mapped(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, name), mmap_mode="r")
+
+        return cls(
+            lines=np.memmap(os.path.join(directory, "lines.bin"), dtype=np.uint8, mode="r"),
+            line_offsets=mapped("line_offsets.npy"),
+            stage_ids=mapped("stage_ids.npy"),
+            stage_names=manifest["stages"],
+            tag_offsets=mapped("tag_offsets.npy"),
+            tag_ids=mapped("tag_ids.npy"),
+            tag_names=manifest["tags"],
+            embeddings=mapped("embeddings.npy"),
+            index=_read_index(os.path.join(directory, "index.faiss")),
+        )
+
+
+def _read_index(path: str) -> faiss.Index:
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        logger.info("Index %s does not support mmap, loading into memory", path)
+        return faiss.read_index(path)
+
+
+def _sort_by_stage(
+    items: Sequence[RetrievalItem], embeddings: np.ndarray
+) -> Tuple[List[RetrievalItem], np.ndarray]:
+    first_seen: Dict[str, int] = {}
+    for item in items:
+        first_seen.setdefault(item.stage, len(first_seen))
+    order = sorted(range(len(items)), key=lambda i: first_seen[items[i].stage])
+    return [items[i] for i in order], np.ascontiguousarray(np.asarray(embeddings)[order], dtype=np.float32)
+
+
+def _stage_ranges(stage_ids: np.ndarray, stage_names: List[str]) -> Dict[str, Tuple[int, int]]:
+    ranges: Dict[str, Tuple[int, int]] = {}
+    ids = np.asarray(stage_ids)
+    if len(ids) and np.any(ids[1:] < ids[:-1]):
+        raise ValueError("Playbook items must be grouped by stage")
+    for stage_id, name in enumerate(stage_names):
+        start = int(np.searchsorted(ids, stage_id, side="left"))
+        end = int(np.searchsorted(ids, stage_id, side="right"))
+        if end > start:
+            ranges[name] = (start, end)
+    return ranges
+
+
+def _encode_metadata(items: Sequence[RetrievalItem]) -> Dict[str, object]:
+    stage_names: List[str] = []
+    stage_lookup: Dict[str, int] = {}
+    tag_names: List[str] = []
+    tag_lookup: Dict[str, int] = {}
+    blob = bytearray()
+    line_offsets = [0]
+    stage_ids = []
+    tag_offsets = [0]
+    tag_ids: List[int] = []
+    for item in items:
+        blob.extend(item.line.encode("utf-8"))
+        line_offsets.append(len(blob))
+        if item.stage not in stage_lookup:
+            stage_lookup[item.stage] = len(stage_names)
+            stage_names.append(item.stage)
+        stage_ids.append(stage_lookup[item.stage])
+        for tag in item.tags:
+            if tag not in tag_lookup:
+                tag_lookup[tag] = len(tag_names)
+                tag_names.append(tag)
+            tag_ids.append(tag_lookup[tag])
+        tag_offsets.append(len(tag_ids))
+    return {
+        "lines": np.frombuffer(bytes(blob), dtype=np.uint8),
+        "line_offsets": np.asarray(line_offsets, dtype=np.int64),
+        "stage_ids": np.asarray(stage_ids, dtype=np.int32),
+        "stage_names": stage_names,
+        "tag_offsets": np.asarray(tag_offsets, dtype=np.int64),
+        "tag_ids": np.asarray(tag_ids, dtype=np.int32),
+        "tag_names": tag_names,
+    }
+
+
+def write_playbook(
+    directory: str,
+    items: Sequence[RetrievalItem],
+    embeddings: np.ndarray,
+    model_name: str,
+    index_type: str,
+    nlist: int = 1024,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+) -> None:
+    os.makedirs(directory, exist_ok=True)
+    items, embeddings = _sort_by_stage(items, embeddings)
+    arrays = _encode_metadata(items)
+    with open(os.path.join(directory, "lines.bin"), "wb") as handle:
+        handle.write(arrays["lines"].tobytes())
+    for name in ("line_offsets", "stage_ids", "tag_offsets", "tag_ids"):
+        np.save(os.path.join(directory, f"{name}.npy"), arrays[name])
+    np.save(os.path.join(directory, "embeddings.npy"), embeddings)
+    index = build_index(embeddings, index_type, nlist=nlist, hnsw_m=hnsw_m, ef_construction=ef_construction)
+    faiss.write_index(index, os.path.join(directory, "index.faiss"))
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "model_name": model_name,
+        "count": len(items),
+        "dim": int(embeddings.shape[1]),
+        "index_type": index_type,
+        "stages": arrays["stage_names"],
+        "tags": arrays["tag_names"],
+    }
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as handle:
+        json.dump(manifest, handle, indent=2)
+
+
+def build_playbook(
+    corpus_path: str,
+    directory: str,
+    encode: Callable[[List[str]], np.ndarray],
+    model_name: str,
+    index_type: str = "hnsw",
+    batch_size: int = 512,
+    **index_params: int,
+) -> int:
+    items = load_corpus(corpus_path)
+    if not items:
+        raise ValueError(f"No playbook lines found in {corpus_path}")
+    chunks = []
+    for start in range(0, len(items), batch_size):
+        batch = [i.line for i in items[start:start + batch_size]]
+        chunks.append(np.asarray(encode(batch), dtype=np.float32))
+    write_playbook(directory, items, np.vstack(chunks), model_name, index_type, **index_params)
+    return len(items)
@@ -1,27 +1,50 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Dict, List, Optional
 
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
+from .batching import MicroBatcher
+from .cache import VECTOR_CODEC, LRUCache, cache_path
 from .config import settings
+from .generation import Scorer, template_candidates
+from .inference import backend_spec, load_embedder, model_key
+from .perception import STAGE_ORDER
+from .playbook import Playbook, RetrievalItem
 
 
 @dataclass
-class RetrievalItem:
-    line: str
-    stage: str
-    tags: List[str]
+class RetrievalResult:
+    items: List[RetrievalItem]
+    vectors: np.ndarray
+    query_vec: Optional[np.ndarray] = None
+
+    @property
+    def lines(self) -> List[str]:
+        return [item.line for item in self.items]
 
 
 class RetrievalEngine:
     def __init__(self) -> None:
-        self.model = SentenceTransformer(settings.model_name)
-        self.items = self._seed_items()
-        self.index, self.embeddings = self._build_index(self.items)
+        self.backend = backend_spec()
+        self.model = load_embedder(settings.model_name, self.backend)
+        self.batcher: MicroBatcher | None = None
+        if settings.batch_inference:
+            self.batcher = MicroBatcher(
+                "embed", self._encode_batch, settings.batch_window_ms, settings.batch_max_size
+            )
+        self.embedding_cache = LRUCache(
+            "embeddings",
+            max_entries=settings.embedding_cache_entries,
+            max_bytes=settings.embedding_cache_mb * 1024 * 1024,
+            sizeof=lambda text, vec: vec.nbytes + len(text),
+            codec=VECTOR_CODEC,
+        )
+        if settings.cache_dir:
+            self.embedding_cache.load(self._cache_path())
+        self.playbook = self._load_playbook()
+        self.template_vectors = self._template_vectors()
 
     def _seed_items(self) -> List[RetrievalItem]:
         return [
@@ -57,26 +80,90 @@ class RetrievalEngine:
             ),
         ]
 
-    def _build_index(self, items: List[RetrievalItem]) -> Tuple[faiss.IndexFlatIP, np.ndarray]:
-        texts = [i.line for i in items]
-        embeddings = self.model.encode(texts, normalize_embeddings=True)
-        dim = embeddings.shape[1]
-        index = faiss.IndexFlatIP(dim)
-        index.add(embeddings.astype(np.float32))
-        return index, embeddings
+    def _load_playbook(self) -> Playbook:
+        if settings.playbook_dir:
+            playbook = Playbook.open(settings.playbook_dir, settings.model_name)
+        else:
+            items = self._seed_items()
+            embeddings = self._encode_batch([i.line for i in items])
+            playbook = Playbook.from_items(items, embeddings)
+        playbook.configure(
+            nprobe=settings.playbook_nprobe,
+            ef_search=settings.playbook_ef_search,
+            exact_scan_max=settings.playbook_exact_scan_max,
+        )
+        return playbook
+
+    def _template_vectors(self) -> Dict[str, np.ndarray]:
+        stages = STAGE_ORDER + [""]
+        lines = list(dict.fromkeys(line for stage in stages for line in template_candidates(stage)))
+        return dict(zip(lines, self._encode_batch(lines)))
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True)
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        if self.batcher is None:
+            return self._encode_batch(texts)
+        return np.asarray(self.batcher.run(texts))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = [self.embedding_cache.get(t) for t in texts]
+        missing = [t for t, v in zip(texts, vectors) if v is None]
+        if missing:
+            unique = list(dict.fromkeys(missing))
+            fresh = {t: vec.copy() for t, vec in zip(unique, self._encode_uncached(unique))}
+            for text, vec in fresh.items():
+                self.embedding_cache.put(text, vec)
+            vectors = [fresh[t] if v is None else v for t, v in zip(texts, vectors)]
+        return np.stack(vectors)
 
-    def query(self, context: str, stage: str, top_k: int) -> List[RetrievalItem]:
+    def _cache_path(self) -> str:
+        return cache_path(
+            settings.cache_dir, "embeddings", model_key(settings.model_name, self.backend), VECTOR_CODEC
+        )
+
+    def save_cache(self) -> None:
+        if settings.cache_dir:
+            self.embedding_cache.save(self._cache_path())
+
+    def retrieve(
+        self, context: str, stage: str, top_k: int, tags: Optional[List[str]] = None
+    ) -> RetrievalResult:
+        query_vec: Optional[np.ndarray] = None
         if not context:
-            return self.items[:top_k]
-        query_vec = self.model.encode([context], normalize_embeddings=True)
-        scores, indices = self.index.search(query_vec.astype(np.float32), top_k)
-        ranked = []
-        for idx in indices[0]:
-            if idx < 0:
-                continue
-            item = self.items[int(idx)]
-            ranked.append(item)
-        stage_matched = [i for i in ranked if i.stage == stage]
-        if stage_matched:
-            return stage_matched[:top_k]
-        return ranked[:top_k]
+            ids = list(range(min(top_k, len(self.playbook))))
+        else:
+            query_vec = self.encode([context])[0]
+            ids = []
+            if self.playbook.has_stage(stage):
+                ids = self.playbook.search(query_vec, top_k, stage=stage, tags=tags)
+            if not ids:
+                ids = self.playbook.search(query_vec, top_k, tags=tags)
+        return RetrievalResult(
+            items=[self.playbook.item(idx) for idx in ids],
+            vectors=self.playbook.vectors(ids),
+            query_vec=query_vec,
+        )
+
+    def query(
+        self, context: str, stage: str, top_k: int, tags: Optional[List[str]] = None
+    ) -> List[RetrievalItem]:
+        return self.retrieve(context, stage, top_k, tags).items
+
+    def line_vectors(self, lines: List[str], known: Dict[str, np.ndarray]) -> np.ndarray:
+        missing = [line for line in lines if line not in known and line not in self.template_vectors]
+        fresh = dict(zip(missing, self.encode(missing))) if missing else {}
+        vectors = []
+        for line in lines:
+            vector = known.get(line)
+            if vector is None:
+                vector = self.template_vectors.get(line)
+            vectors.append(fresh[line] if vector is None else vector)
+        return np.stack(vectors)
+
+    def scorer(self, result: RetrievalResult) -> Optional[Scorer]:
+        if result.query_vec is None:
+            return None
+        known = dict(zip(result.lines, result.vectors))
+        return lambda lines: self.line_vectors(lines, known) @ result.query_vec
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Literal
+from typing import List, Literal, Optional
 
 
 class TranscriptMessage(BaseModel):
@@ -8,6 +8,11 @@ class TranscriptMessage(BaseModel):
     timestamp_ms: int
 
 
+class TranscriptBatch(BaseModel):
+    messages: List[TranscriptMessage]
+    session_id: Optional[str] = None
+
+
 class LiveMetrics(BaseModel):
     talk_listen_ratio: float
     questions_per_minute: float
@@ -16,3 +21,6 @@ class LiveMetrics(BaseModel):
     methodology_stage: str
     say_next: List[str]
     last_update_ms: int
+    provisional_text: str = ""
+    say_next_ms: int = 0
+    quality_tier: str = "full"
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import signal
+
+from . import cluster
+from .config import settings
+
+
+logger = logging.getLogger(__name__)
+
+MAX_HEAD_BYTES = 65536
+UNAVAILABLE = b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+TOO_LARGE = b"HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+def parse_head(head: bytes) -> Tuple[str, str, Dict[str, str]]:
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers: Dict[str, str] = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def close_after_response(head: bytes) -> bytes:
+    lines = [line for line in head[:-4].split(b"\r\n") if not line.lower().startswith(b"connection:")]
+    lines.append(b"Connection: close")
+    return b"\r\n".join(lines) + b"\r\n\r\n"
+
+
+def body_session_id(body: bytes) -> str:
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return ""
+    value = payload.get("session_id") if isinstance(payload, dict) else None
+    return value if isinstance(value, str) else ""
+
+
+async def copy_stream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+    except (ConnectionError, OSError):
+        pass
+
+
+class Router:
+    def __init__(self, sockets: List[str], max_peek_body_bytes: int) -> None:
+        self.sockets = sockets
+        self.max_peek_body_bytes = max_peek_body_bytes
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            method, target, headers = parse_head(head)
+            session_id = parse_qs(urlsplit(target).query).get("session_id", [""])[0]
+            body = b""
+            length = int(headers.get("content-length") or 0)
+            if not session_id and method == "POST" and length > self.max_peek_body_bytes:
+                writer.write(TOO_LARGE)
+                await writer.drain()
+                writer.close()
+                return
+            if not session_id and method == "POST" and length > 0:
+                body = await reader.readexactly(length)
+                session_id = body_session_id(body)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            writer.close()
+            return
+        if headers.get("upgrade", "").lower() != "websocket":
+            head = close_after_response(head)
+        worker_id = cluster.route(session_id, len(self.sockets))
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_unix_connection(self.sockets[worker_id])
+        except OSError:
+            writer.write(UNAVAILABLE)
+            writer.close()
+            return
+        upstream_writer.write(head + body)
+        upload = asyncio.create_task(copy_stream(reader, upstream_writer))
+        await copy_stream(upstream_reader, writer)
+        upload.cancel()
+        upstream_writer.close()
+        writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD_BYTES)
+        logger.info("Routing %s:%d to %d workers", host, port, len(self.sockets))
+        async with server:
+            await server.serve_forever()
+
+
+def run_worker(worker_id: int, workers: int, state_dir: str, log_level: str) -> None:
+    import uvicorn
+
+    from . import main as service
+
+    cluster.configure(worker_id, workers, state_dir)
+    path = cluster.socket_path(state_dir, worker_id)
+    if os.path.exists(path):
+        os.unlink(path)
+    config = uvicorn.Config(service.app, uds=path, log_level=log_level)
+    uvicorn.Server(config).run()
+
+
+class Supervisor:
+    def __init__(self, workers: int, host: str, port: int, state_dir: str, log_level: str) -> None:
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.state_dir = state_dir
+        self.log_level = log_level
+        self.children: Dict[int, str] = {}
+        self.stopping = False
+
+    def fork(self, role: str, target: Callable[[], None]) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                target()
+            except BaseException:
+                logger.exception("%s exited with an error", role)
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = role
+
+    def spawn(self, role: str) -> None:
+        if role == "router":
+            router = Router(
+                [cluster.socket_path(self.state_dir, i) for i in range(self.workers)],
+                settings.router_max_peek_body_mb * 1024 * 1024,
+            )
+            self.fork(role, lambda: asyncio.run(router.serve(self.host, self.port)))
+            return
+        worker_id = int(role.split("-", 1)[1])
+        self.fork(role, lambda: run_worker(worker_id, self.workers, self.state_dir, self.log_level))
+
+    def stop(self, signum: int, frame: object) -> None:
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        from . import main as service
+
+        logger.info("Loading models before forking %d workers", self.workers)
+        service.state.models.load_all()
+        for name, info in service.state.models.status().items():
+            logger.info("Model %s: %s", name, info["status"])
+        gc.collect()
+        gc.freeze()
+
+        for worker_id in range(self.workers):
+            self.spawn(f"worker-{worker_id}")
+        self.spawn("router")
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            role = self.children.pop(pid, None)
+            if role is None or self.stopping:
+                continue
+            logger.warning("%s (pid %d) exited with status %d, restarting", role, pid, status)
+            self.spawn(role)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the coach service as a pre-forked multi-process server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.workers)
+    parser.add_argument("--state-dir", default=settings.state_dir, help="Worker sockets, stats snapshots and bandit DB")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(process)d %(name)s %(message)s")
+    os.makedirs(args.state_dir, exist_ok=True)
+    settings.workers = args.workers
+    settings.state_dir = args.state_dir
+    if not settings.bandit_db:
+        settings.bandit_db = os.path.join(args.state_dir, "bandit.db")
+    if settings.inference_backend != "torch":
+        settings.inference_threads = 1
+    elif not settings.inference_threads:
+        settings.inference_threads = max(1, (os.cpu_count() or 1) // args.workers)
+    Supervisor(args.workers, args.host, args.port, args.state_dir, args.log_level).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+import logging
+import time
+
+from .audio import AudioStats
+from .config import settings
+from .perception import PerceptionEngine
+from .schemas import LiveMetrics, TranscriptMessage
+from .summary import RollingSummary, checkpoint_json, create_summary, load_checkpoint, write_checkpoint
+from .transcript import TranscriptLog, open_transcript
+from .vision import VisionStats
+
+
+logger = logging.getLogger(__name__)
+
+
+def initial_metrics() -> LiveMetrics:
+    return LiveMetrics(
+        talk_listen_ratio=0.0,
+        questions_per_minute=0.0,
+        sentiment=0.0,
+        engagement=0.6,
+        methodology_stage="connect",
+        say_next=["Welcome. Start with an open question."],
+        last_update_ms=int(time.time() * 1000),
+    )
+
+
+@dataclass
+class SessionState:
+    session_id: str
+    perception: PerceptionEngine
+    last_metrics: LiveMetrics
+    last_suggestions: List[str] = field(default_factory=list)
+    shown_lines: Dict[str, None] = field(default_factory=dict)
+    vision_engagement: float = 0.5
+    last_seen: float = field(default_factory=time.monotonic)
+    last_suggested: float = float("-inf")
+    last_ingest_ms: int = 0
+    audio_stats: AudioStats = field(default_factory=AudioStats)
+    vision_stats: VisionStats = field(default_factory=VisionStats)
+    transcript: Optional[TranscriptLog] = None
+    summary: RollingSummary = field(default_factory=create_summary)
+    checkpointed: int = 0
+    pending_checkpoint: Optional[str] = None
+
+    def touch(self) -> None:
+        self.last_seen = time.monotonic()
+
+
+def create_session(session_id: str) -> SessionState:
+    session = SessionState(
+        session_id=session_id,
+        perception=PerceptionEngine(max_history=settings.max_history),
+        last_metrics=initial_metrics(),
+        transcript=open_transcript(session_id),
+    )
+    if session.transcript is not None and len(session.transcript):
+        restore_session(session)
+    return session
+
+
+def restore_session(session: SessionState) -> None:
+    log = session.transcript
+    checkpoint = load_checkpoint(log)
+    counters = None
+    if checkpoint is not None:
+        session.summary, counters = checkpoint
+    done = session.summary.messages
+    start = min(done, max(0, len(log) - settings.max_history))
+    messages = log.iter_messages(start)
+    for _ in range(start, done):
+        session.perception.ingest(next(messages))
+    if counters is not None:
+        session.perception.restore_counters(counters)
+    for index, message in enumerate(messages, done):
+        record_message(session, index, message)
+    session.checkpointed = done
+    checkpoint_session(session)
+
+
+def checkpoint_session(session: SessionState, force: bool = False) -> None:
+    log = session.transcript
+    pending = session.summary.messages - session.checkpointed
+    if log is None or log.failed or pending <= 0:
+        return
+    if not force and pending < settings.summary_checkpoint_every:
+        return
+    session.pending_checkpoint = checkpoint_json(session.summary, session.perception)
+    session.checkpointed = session.summary.messages
+
+
+def write_session(session: SessionState) -> None:
+    log = session.transcript
+    if log is None:
+        return
+    payload, session.pending_checkpoint = session.pending_checkpoint, None
+    log.flush()
+    if payload is None or log.failed:
+        return
+    try:
+        write_checkpoint(payload, log)
+    except OSError:
+        logger.exception("Cannot write summary checkpoint for session %s", session.session_id)
+
+
+def release_session(session: SessionState) -> None:
+    write_session(session)
+    if session.transcript is not None:
+        session.transcript.close()
+
+
+def record_message(session: SessionState, index: int, message: TranscriptMessage) -> None:
+    sentiment = session.perception.ingest(message)
+    session.summary.add(
+        index, message.speaker, message.text, message.timestamp_ms, session.perception.stage(), sentiment
+    )
+
+
+class SessionRegistry:
+    def __init__(self, ttl_sec: float, max_sessions: int) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.latest_id: Optional[str] = None
+        self.evicted = 0
+        self.listeners: List[Callable[[SessionState], None]] = []
+        self.closer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-close")
+        self.closing: Dict[str, Future] = {}
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        return self.sessions.get(session_id)
+
+    def get_or_create(self, session_id: str) -> SessionState:
+        session = self.sessions.get(session_id)
+        if session is None:
+            closing = self.closing.pop(session_id, None)
+            if closing is not None:
+                closing.result()
+            session = create_session(session_id)
+            self.sessions[session_id] = session
+            self._evict_overflow()
+        else:
+            self.sessions.move_to_end(session_id)
+        session.touch()
+        return session
+
+    def mark_updated(self, session: SessionState) -> None:
+        session.touch()
+        self.latest_id = session.session_id
+        if session.session_id in self.sessions:
+            self.sessions.move_to_end(session.session_id)
+        for listener in self.listeners:
+            listener(session)
+
+    def latest(self) -> Optional[SessionState]:
+        if self.latest_id is not None and self.latest_id in self.sessions:
+            return self.sessions[self.latest_id]
+        if self.sessions:
+            return next(reversed(self.sessions.values()))
+        return None
+
+    def evict_expired(self, now: Optional[float] = None) -> List[str]:
+        now = time.monotonic() if now is None else now
+        expired = []
+        for session_id, session in self.sessions.items():
+            if now - session.last_seen < self.ttl_sec:
+                break
+            expired.append(session_id)
+        for session_id in expired:
+            self._remove(session_id)
+        return expired
+
+    def snapshot(self) -> Dict[str, SessionState]:
+        return dict(self.sessions)
+
+    def _evict_overflow(self) -> None:
+        while len(self.sessions) > self.max_sessions:
+            session_id = next(iter(self.sessions))
+            self._remove(session_id)
+
+    def _remove(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id, None)
+        if session is not None and session.transcript is not None:
+            checkpoint_session(session, force=True)
+            self.closing = {key: future for key, future in self.closing.items() if not future.done()}
+            self.closing[session_id] = self.closer.submit(self._release, session)
+        self.evicted += 1
+        if self.latest_id == session_id:
+            self.latest_id = None
+
+    def _release(self, session: SessionState) -> None:
+        try:
+            release_session(session)
+        except Exception:
+            logger.exception("Cannot close session %s", session.session_id)
+
+    def close(self) -> None:
+        for session in self.sessions.values():
+            checkpoint_session(session, force=True)
+            self._release(session)
+        self.closer.shutdown(wait=True)
@@ -1,85 +1,302 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Any, Hashable, List, Optional
+import math
+import re
 import time
 
-from .generation import GeneratorEngine
+from .admission import CACHED_ONLY, FULL, NO_LLM, NO_RERANK, TIERS
+from .cache import LRUCache, fingerprint
+from .generation import (
+    NEGATIVE_SENTIMENT,
+    GeneratorEngine,
+    LLMBudget,
+    Scorer,
+    filter_for_sentiment,
+    generation_config,
+    load_text_generator,
+    shortlist,
+    template_candidates,
+)
 from .learning import BanditState
-from .perception import PerceptionEngine
+from .models import ModelRegistry
 from .retrieval import RetrievalEngine
 from .schemas import LiveMetrics, TranscriptMessage
 from .config import settings
+from .sessions import SessionRegistry, SessionState, checkpoint_session, record_message
+from .telemetry import (
+    MESSAGES_INGESTED,
+    SUGGESTION_CACHE_HITS,
+    SUGGESTION_CACHE_MISSES,
+    SUGGESTIONS_COMPUTED,
+    stage_timer,
+)
 from .vision import VisionResult
 
 
+PERCEPTION_TIMER = stage_timer("perception")
+RETRIEVAL_TIMER = stage_timer("retrieval")
+GENERATION_TIMER = stage_timer("generation")
+BANDIT_TIMER = stage_timer("bandit")
+TRANSCRIPT_TIMER = stage_timer("transcript")
+
+
+def create_suggestion_cache() -> LRUCache:
+    return LRUCache(
+        "suggestions",
+        max_entries=settings.suggestion_cache_entries,
+        max_bytes=settings.suggestion_cache_mb * 1024 * 1024,
+        sizeof=lambda key, lines: sum(len(line) for line in lines) + 128,
+    )
+
+
 @dataclass
 class SharedState:
-    perception: PerceptionEngine
-    retrieval: RetrievalEngine
-    generator: GeneratorEngine
     bandit: BanditState
-    last_suggestions: List[str]
-    vision_engagement: float
-    last_metrics: LiveMetrics
+    sessions: SessionRegistry
+    models: ModelRegistry
+    suggestion_cache: LRUCache = field(default_factory=create_suggestion_cache)
+
+    @property
+    def retrieval(self) -> Optional[RetrievalEngine]:
+        return self.models.get("retrieval")
+
+    @property
+    def generator(self) -> Optional[GeneratorEngine]:
+        return self.models.get("generator")
+
+
+@dataclass
+class SuggestionInput:
+    stage: str
+    context: str
+    sentiment: float
+    as_of_ms: int
 
 
 def create_state() -> SharedState:
-    perception = PerceptionEngine(max_history=settings.max_history)
-    retrieval = RetrievalEngine()
-    generator = GeneratorEngine()
-    bandit = BanditState()
+    config = generation_config()
+    bandit = BanditState(
+        db_path=settings.bandit_db, strategy=settings.bandit_strategy, ucb_c=settings.bandit_ucb_c
+    )
+    sessions = SessionRegistry(ttl_sec=settings.session_ttl_sec, max_sessions=settings.max_sessions)
+    models = ModelRegistry()
+    state = SharedState(bandit=bandit, sessions=sessions, models=models)
+
+    def attach_llm(text_generator: Any) -> None:
+        generator = state.generator
+        if generator is not None:
+            generator.text_generator = text_generator
+
+    models.add(
+        "retrieval",
+        RetrievalEngine,
+        warmup=lambda engine: engine.query("warm up", "connect", settings.top_k),
+    )
+    models.add(
+        "generator",
+        lambda: GeneratorEngine(config),
+        warmup=lambda engine: engine.generate("warm up", "connect", [], 0.0),
+    )
+    models.add(
+        "llm",
+        lambda: load_text_generator(config),
+        warmup=lambda text_generator: text_generator("Question:", max_new_tokens=1),
+        on_ready=attach_llm,
+        enabled=config.enable_llm,
+    )
+    return state
+
+
+def ingest_message(state: SharedState, session: SessionState, message: TranscriptMessage) -> SuggestionInput:
+    return ingest_messages(state, session, [message])
+
+
+def ingest_messages(
+    state: SharedState, session: SessionState, messages: List[TranscriptMessage]
+) -> SuggestionInput:
+    perception = session.perception
+    start = session.summary.messages
+    if session.transcript is not None:
+        with TRANSCRIPT_TIMER.time():
+            start = session.transcript.append(messages)
+    with PERCEPTION_TIMER.time():
+        for offset, message in enumerate(messages):
+            record_message(session, start + offset, message)
+        stage = perception.stage()
+        sentiment = perception.sentiment()
+        engagement = (perception.engagement() * 0.7) + (session.vision_engagement * 0.3)
+    checkpoint_session(session)
+    MESSAGES_INGESTED.inc(len(messages))
     now_ms = int(time.time() * 1000)
-    metrics = LiveMetrics(
-        talk_listen_ratio=0.0,
-        questions_per_minute=0.0,
-        sentiment=0.0,
-        engagement=0.6,
-        methodology_stage="connect",
-        say_next=["Welcome. Start with an open question."],
-        last_update_ms=now_ms,
+    metrics = session.last_metrics.model_copy(
+        update={
+            "talk_listen_ratio": perception.talk_listen_ratio(),
+            "questions_per_minute": perception.questions_per_minute(),
+            "sentiment": sentiment,
+            "engagement": engagement,
+            "methodology_stage": stage,
+            "last_update_ms": now_ms,
+            "provisional_text": "",
+        }
+    )
+    session.last_metrics = metrics
+    session.last_ingest_ms = now_ms
+    state.sessions.mark_updated(session)
+    context = " ".join(perception.recent_context())
+    return SuggestionInput(stage=stage, context=context, sentiment=sentiment, as_of_ms=now_ms)
+
+
+DISFLUENCIES = re.compile(r"\b(?:um+|uh+|hm+|like|you know)\b")
+
+
+def context_fingerprint(context: str) -> str:
+    text = DISFLUENCIES.sub(" ", re.sub(r"[^\w\s?]", " ", context.lower()))
+    return fingerprint(" ".join(text.split()))
+
+
+def sentiment_bucket(sentiment: float) -> tuple:
+    return (sentiment >= NEGATIVE_SENTIMENT, math.floor(sentiment / settings.suggestion_sentiment_bucket))
+
+
+def suggestion_key(state: SharedState, inputs: SuggestionInput, llm: bool) -> Hashable:
+    return (
+        state.models.version,
+        inputs.stage,
+        sentiment_bucket(inputs.sentiment),
+        context_fingerprint(inputs.context),
+        llm,
     )
-    return SharedState(
-        perception=perception,
-        retrieval=retrieval,
-        generator=generator,
-        bandit=bandit,
-        last_suggestions=[],
-        vision_engagement=0.5,
-        last_metrics=metrics,
+
+
+def rank_suggestions(state: SharedState, generated: List[str]) -> List[str]:
+    with BANDIT_TIMER.time():
+        ranked = state.bandit.rank(generated)
+    return ranked[:3]
+
+
+def cached_suggestions(state: SharedState, inputs: SuggestionInput, llm: bool = False) -> Optional[List[str]]:
+    generated = state.suggestion_cache.get(suggestion_key(state, inputs, llm))
+    if generated is None:
+        SUGGESTION_CACHE_MISSES.inc()
+        return None
+    SUGGESTION_CACHE_HITS.inc()
+    return rank_suggestions(state, generated)
+
+
+def compute_suggestions(
+    state: SharedState,
+    inputs: SuggestionInput,
+    extra: Optional[List[str]] = None,
+    use_cache: bool = True,
+    tier: int = FULL,
+) -> List[str]:
+    if use_cache and extra is None:
+        cached = cached_suggestions(state, inputs)
+        if cached is not None:
+            return cached
+    SUGGESTIONS_COMPUTED.inc()
+    if tier >= CACHED_ONLY:
+        templates = filter_for_sentiment(template_candidates(inputs.stage), inputs.sentiment)
+        return rank_suggestions(state, templates)
+    key = suggestion_key(state, inputs, extra is not None)
+    retrieval = state.retrieval
+    generator = state.generator
+    retrieved_lines: List[str] = []
+    scorer: Optional[Scorer] = None
+    if retrieval is not None:
+        with RETRIEVAL_TIMER.time():
+            result = retrieval.retrieve(inputs.context, inputs.stage, settings.top_k)
+        retrieved_lines = result.lines
+        scorer = retrieval.scorer(result)
+    if generator is not None and tier < NO_RERANK:
+        with GENERATION_TIMER.time():
+            generated = generator.generate(
+                inputs.context,
+                inputs.stage,
+                retrieved_lines,
+                inputs.sentiment,
+                extra=extra,
+                llm=tier < NO_LLM,
+                scorer=scorer,
+            )
+    else:
+        base = retrieved_lines + template_candidates(inputs.stage)
+        unique = list(dict.fromkeys(filter_for_sentiment(base, inputs.sentiment)))
+        generated = shortlist(unique, scorer, settings.rerank_shortlist)
+    degraded = generator is not None and (tier >= NO_RERANK or (tier == NO_LLM and generator.inline_llm))
+    if not degraded:
+        state.suggestion_cache.put(key, generated)
+    return rank_suggestions(state, generated)
+
+
+def compute_llm_upgrade(
+    state: SharedState, inputs: SuggestionInput, budget: LLMBudget
+) -> Optional[List[str]]:
+    generator = state.generator
+    if generator is None:
+        return None
+    cached = cached_suggestions(state, inputs, llm=True)
+    if cached is not None:
+        return cached
+    lines = generator.generate_llm(inputs.context, inputs.stage, budget)
+    if not lines or budget.cancelled:
+        return None
+    return compute_suggestions(state, inputs, extra=lines)
+
+
+def apply_suggestions(
+    state: SharedState, session: SessionState, say_next: List[str], as_of_ms: int, tier: int = FULL
+) -> LiveMetrics:
+    if as_of_ms < session.last_metrics.say_next_ms:
+        return session.last_metrics
+    new_lines = [line for line in say_next if line not in session.shown_lines]
+    session.shown_lines.update(dict.fromkeys(new_lines))
+    state.bandit.register_lines(new_lines)
+    session.last_suggestions = say_next
+    metrics = session.last_metrics.model_copy(
+        update={
+            "say_next": say_next,
+            "say_next_ms": as_of_ms,
+            "quality_tier": TIERS[tier],
+            "last_update_ms": int(time.time() * 1000),
+        }
     )
+    session.last_metrics = metrics
+    state.sessions.mark_updated(session)
+    return metrics
+
+
+def record_outcome(state: SharedState, session: SessionState, outcome: str) -> int:
+    lines = list(session.shown_lines)
+    state.bandit.apply_outcome(lines, outcome)
+    session.shown_lines.clear()
+    return len(lines)
+
+
+def update_metrics(state: SharedState, session: SessionState, message: TranscriptMessage) -> LiveMetrics:
+    inputs = ingest_message(state, session, message)
+    say_next = compute_suggestions(state, inputs)
+    return apply_suggestions(state, session, say_next, inputs.as_of_ms)
 
 
-def update_metrics(state: SharedState, message: TranscriptMessage) -> LiveMetrics:
-    state.perception.ingest(message)
-    stage = state.perception.stage()
-    context = " ".join(state.perception.recent_context())
-    candidates = state.retrieval.query(context, stage, settings.top_k)
-    retrieved_lines = [c.line for c in candidates]
-    sentiment = state.perception.sentiment()
-    generated = state.generator.generate(context, stage, retrieved_lines, sentiment)
-    ranked = state.bandit.rank(generated)
-    say_next = ranked[:3]
-    state.bandit.register_lines(say_next)
-    state.last_suggestions = say_next
-    engagement = (state.perception.engagement() * 0.7) + (state.vision_engagement * 0.3)
-    metrics = LiveMetrics(
-        talk_listen_ratio=state.perception.talk_listen_ratio(),
-        questions_per_minute=state.perception.questions_per_minute(),
-        sentiment=sentiment,
-        engagement=engagement,
-        methodology_stage=stage,
-        say_next=say_next,
-        last_update_ms=int(time.time() * 1000),
+def update_provisional(state: SharedState, session: SessionState, text: str) -> LiveMetrics:
+    if session.last_metrics.provisional_text == text:
+        return session.last_metrics
+    metrics = session.last_metrics.model_copy(
+        update={"provisional_text": text, "last_update_ms": int(time.time() * 1000)}
     )
-    state.last_metrics = metrics
+    session.last_metrics = metrics
+    state.sessions.mark_updated(session)
     return metrics
 
 
-def update_vision(state: SharedState, vision: VisionResult) -> LiveMetrics:
-    state.vision_engagement = vision.gaze_score if vision.face_present else 0.2
-    metrics = state.last_metrics.model_copy(deep=True)
-    metrics.engagement = (state.perception.engagement() * 0.7) + (state.vision_engagement * 0.3)
+def update_vision(state: SharedState, session: SessionState, vision: VisionResult) -> LiveMetrics:
+    session.vision_engagement = vision.gaze_score if vision.face_present else 0.2
+    metrics = session.last_metrics.model_copy(deep=True)
+    metrics.engagement = (session.perception.engagement() * 0.7) + (session.vision_engagement * 0.3)
     metrics.last_update_ms = int(time.time() * 1000)
-    state.last_metrics = metrics
+    session.last_metrics = metrics
+    state.sessions.mark_updated(session)
     return metrics
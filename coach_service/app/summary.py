@@ -1,16 +1,183 @@
 from __future__ import annotations
 
-from typing import List
+from collections import deque
+from dataclasses import dataclass, field, fields
+from typing import Deque, Dict, List, Optional, Tuple
+import heapq
+import json
+import os
+import time
+
+from .config import settings
 from .schemas import LiveMetrics
-from .perception import PerceptionEngine
+from .perception import COUNTERS, STAGE_MATCHER, PerceptionEngine
+from .transcript import TranscriptLog, checkpoint_path
+
+
+@dataclass
+class RollingSummary:
+    key_line_limit: int = 5
+    bucket_sec: float = 60.0
+    max_buckets: int = 720
+    messages: int = 0
+    first_ms: int = 0
+    last_ms: int = 0
+    last_stage: str = ""
+    stage_ms: Dict[str, int] = field(default_factory=dict)
+    stage_changes: Deque[Tuple[int, str]] = field(default_factory=lambda: deque(maxlen=200))
+    sentiment_buckets: List[List[float]] = field(default_factory=list)
+    questions: Dict[str, int] = field(default_factory=lambda: {"rep": 0, "prospect": 0})
+    words: Dict[str, int] = field(default_factory=lambda: {"rep": 0, "prospect": 0})
+    key_lines: List[Tuple[float, int, str]] = field(default_factory=list)
+
+    def add(self, index: int, speaker: str, text: str, timestamp_ms: int, stage: str, sentiment: float) -> None:
+        now_ms = int(time.time() * 1000)
+        first = self.messages == 0
+        if first:
+            self.first_ms = min(max(timestamp_ms, 0), now_ms)
+        timestamp_ms = min(max(timestamp_ms, self.first_ms), now_ms)
+        if not first and self.last_stage:
+            self.stage_ms[self.last_stage] = self.stage_ms.get(self.last_stage, 0) + max(
+                0, timestamp_ms - self.last_ms
+            )
+        if stage != self.last_stage:
+            self.stage_changes.append((timestamp_ms, stage))
+        self.messages += 1
+        self.last_ms = max(self.last_ms, timestamp_ms)
+        self.last_stage = stage
+        self.questions[speaker] += text.count("?")
+        self.words[speaker] += len(text.split())
+
+        bucket = min(int((timestamp_ms - self.first_ms) / 1000 // self.bucket_sec), self.max_buckets - 1)
+        while len(self.sentiment_buckets) <= bucket:
+            self.sentiment_buckets.append([0.0, 0])
+        self.sentiment_buckets[bucket][0] += sentiment
+        self.sentiment_buckets[bucket][1] += 1
+
+        if speaker == "prospect" and text[:160] not in {line for _, _, line in self.key_lines}:
+            entry = (self._salience(text, sentiment), index, text[:160])
+            if len(self.key_lines) < self.key_line_limit:
+                heapq.heappush(self.key_lines, entry)
+            elif entry > self.key_lines[0]:
+                heapq.heapreplace(self.key_lines, entry)
+
+    def _salience(self, text: str, sentiment: float) -> float:
+        lower = text.lower()
+        stages = {m.lastgroup for m in STAGE_MATCHER.finditer(lower)} - {"connect"}
+        return abs(sentiment) + 0.5 * len(stages) + min(len(text.split()), 30) / 60
+
+    def sentiment_trajectory(self, points: int = 0) -> List[Optional[float]]:
+        buckets = self.sentiment_buckets
+        if points and len(buckets) > points:
+            step = -(-len(buckets) // points)
+            buckets = [
+                [sum(b[0] for b in buckets[i:i + step]), sum(b[1] for b in buckets[i:i + step])]
+                for i in range(0, len(buckets), step)
+            ]
+        return [round(total / count, 3) if count else None for total, count in buckets]
+
+    def top_line_indices(self) -> List[int]:
+        return sorted(index for _, index, _ in self.key_lines)
+
+    def as_dict(self) -> dict:
+        return {
+            "messages": self.messages,
+            "duration_sec": round((self.last_ms - self.first_ms) / 1000, 1),
+            "stage_sec": {stage: round(ms / 1000, 1) for stage, ms in self.stage_ms.items()},
+            "stage_changes": [{"timestamp_ms": ts, "stage": stage} for ts, stage in self.stage_changes],
+            "sentiment_per_bucket": self.sentiment_trajectory(),
+            "bucket_sec": self.bucket_sec,
+            "questions": dict(self.questions),
+            "words": dict(self.words),
+        }
+
+
+CHECKPOINT_VERSION = 2
+CHECKPOINT_CONFIG = ("key_line_limit", "bucket_sec", "max_buckets")
+
+
+def checkpoint_json(summary: RollingSummary, perception: PerceptionEngine) -> str:
+    data = {f.name: getattr(summary, f.name) for f in fields(summary)}
+    data["stage_changes"] = list(summary.stage_changes)
+    data["perception"] = perception.counters()
+    data["version"] = CHECKPOINT_VERSION
+    return json.dumps(data)
+
+
+def write_checkpoint(payload: str, log: TranscriptLog) -> None:
+    path = checkpoint_path(log.path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as handle:
+        handle.write(payload)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(log: TranscriptLog) -> Optional[Tuple[RollingSummary, Dict[str, int]]]:
+    try:
+        with open(checkpoint_path(log.path), encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    summary = create_summary()
+    if data.get("version") != CHECKPOINT_VERSION or not 0 < data.get("messages", 0) <= len(log):
+        return None
+    if any(data.get(name) != getattr(summary, name) for name in CHECKPOINT_CONFIG):
+        return None
+    try:
+        for f in fields(summary):
+            if f.name not in CHECKPOINT_CONFIG:
+                setattr(summary, f.name, data[f.name])
+        summary.stage_changes = deque((tuple(change) for change in data["stage_changes"]), maxlen=200)
+        summary.key_lines = [tuple(entry) for entry in data["key_lines"]]
+        counters = {name: int(data["perception"][name]) for name in COUNTERS}
+    except (KeyError, TypeError, ValueError):
+        return None
+    return summary, counters
+
+
+def create_summary() -> RollingSummary:
+    return RollingSummary(
+        key_line_limit=settings.summary_key_lines,
+        bucket_sec=settings.summary_bucket_sec,
+        max_buckets=settings.summary_max_buckets,
+    )
+
+
+def key_prospect_lines(summary: RollingSummary, log: Optional[TranscriptLog]) -> List[str]:
+    indices = summary.top_line_indices()
+    if log is not None and not log.failed and indices and indices[-1] < len(log):
+        return [m.text for m in log.read(indices)]
+    return [text for _, _, text in sorted(summary.key_lines, key=lambda entry: entry[1])]
 
 
-def build_summary(perception: PerceptionEngine, metrics: LiveMetrics) -> str:
+def build_summary(
+    perception: PerceptionEngine,
+    metrics: LiveMetrics,
+    summary: Optional[RollingSummary] = None,
+    log: Optional[TranscriptLog] = None,
+) -> str:
     lines = []
     lines.append("Call summary")
     lines.append(f"Stage: {metrics.methodology_stage}")
     lines.append(f"Talk to listen: {metrics.talk_listen_ratio:.2f}")
     lines.append(f"Sentiment: {metrics.sentiment:.2f}")
+    if summary is not None and summary.messages:
+        details = summary.as_dict()
+        lines.append(f"Messages: {details['messages']} over {details['duration_sec'] / 60:.1f} min")
+        stage_time = ", ".join(f"{stage} {sec / 60:.1f} min" for stage, sec in details["stage_sec"].items())
+        if stage_time:
+            lines.append(f"Time per stage: {stage_time}")
+        trajectory = [f"{value:+.2f}" for value in summary.sentiment_trajectory(points=12) if value is not None]
+        if trajectory:
+            lines.append(f"Sentiment trajectory: {' '.join(trajectory)}")
+        lines.append(
+            f"Questions: rep {details['questions']['rep']}, prospect {details['questions']['prospect']}"
+        )
+        key_lines = key_prospect_lines(summary, log)
+        if key_lines:
+            lines.append("Key prospect lines:")
+            for text in key_lines:
+                lines.append(f"- {text}")
     lines.append("Recent transcript:")
     for message in perception.recent_messages():
         lines.append(f"- {message.speaker}: {message.text}")
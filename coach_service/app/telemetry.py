@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+MERGES = {"sum": lambda a, b: a + b, "max": max}
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[Tuple[str, str], ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+    def series(self) -> List[dict]:
+        return [{"labels": list(self.labels), "value": self.value}]
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, read: Callable[[], float], merge: str = "sum") -> None:
+        if merge not in MERGES:
+            raise ValueError(f"Unknown gauge merge: {merge}")
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+        self.merge = merge
+
+    def series(self) -> List[dict]:
+        return [{"labels": [], "value": float(self.read())}]
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        labels: Tuple[Tuple[str, str], ...] = (),
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[idx] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def series(self) -> List[dict]:
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        return [{"labels": list(self.labels), "buckets": list(self.buckets), "counts": counts, "sum": total}]
+
+
+class Family:
+    def __init__(self, name: str, help_text: str, label: str, factory: Callable[..., object]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.factory = factory
+        self.children: Dict[str, object] = {}
+        self.lock = threading.Lock()
+
+    def labels(self, value: str):
+        child = self.children.get(value)
+        if child is None:
+            with self.lock:
+                child = self.children.get(value)
+                if child is None:
+                    child = self.factory(self.name, self.help_text, labels=((self.label, value),))
+                    self.children[value] = child
+        return child
+
+    def series(self) -> List[dict]:
+        series: List[dict] = []
+        for child in list(self.children.values()):
+            series.extend(child.series())
+        return series
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Tuple[str, object]] = {}
+
+    def _add(self, kind: str, name: str, metric: object) -> object:
+        if name in self.metrics:
+            raise ValueError(f"Metric already registered: {name}")
+        self.metrics[name] = (kind, metric)
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._add("counter", name, Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add("histogram", name, Histogram(name, help_text, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float], merge: str = "sum") -> Gauge:
+        return self._add("gauge", name, Gauge(name, help_text, read, merge))
+
+    def histogram_family(self, name: str, help_text: str, label: str) -> Family:
+        return self._add("histogram", name, Family(name, help_text, label, Histogram))
+
+    def counter_family(self, name: str, help_text: str, label: str) -> Family:
+        return self._add("counter", name, Family(name, help_text, label, Counter))
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            name: {
+                "kind": kind,
+                "help": metric.help_text,
+                "merge": getattr(metric, "merge", "sum"),
+                "series": metric.series(),
+            }
+            for name, (kind, metric) in self.metrics.items()
+        }
+
+    def render(self) -> str:
+        return render_snapshot(self.snapshot())
+
+
+def _series_key(series: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple((k, v) for k, v in series["labels"])
+
+
+def merge_snapshots(snapshots: List[Dict[str, dict]]) -> Dict[str, dict]:
+    merged: Dict[str, dict] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {"kind": metric["kind"], "help": metric["help"], "index": {}})
+            for series in metric["series"]:
+                key = _series_key(series)
+                current = target["index"].get(key)
+                if current is None:
+                    current = dict(series)
+                    if "counts" in series:
+                        current["counts"] = list(series["counts"])
+                    target["index"][key] = current
+                elif "counts" in series:
+                    current["counts"] = [a + b for a, b in zip(current["counts"], series["counts"])]
+                    current["sum"] += series["sum"]
+                else:
+                    current["value"] = MERGES[metric.get("merge", "sum")](current["value"], series["value"])
+    return {
+        name: {"kind": metric["kind"], "help": metric["help"], "series": list(metric["index"].values())}
+        for name, metric in merged.items()
+    }
+
+
+def render_snapshot(snapshot: Dict[str, dict]) -> str:
+    lines: List[str] = []
+    for name, metric in snapshot.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for series in metric["series"]:
+            labels = _series_key(series)
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(series['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(series["buckets"]) + [float("inf")], series["counts"]):
+                cumulative += count
+                label = _format_labels(labels, ("le", _format_value(bound)))
+                lines.append(f"{name}_bucket{label} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(series['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram_family(
+    "coach_stage_duration_seconds", "Time spent in each pipeline stage.", "stage"
+)
+MESSAGES_INGESTED = registry.counter("coach_messages_ingested_total", "Transcript messages applied to perception.")
+SUGGESTIONS_COMPUTED = registry.counter("coach_suggestions_computed_total", "Suggestion pipeline runs.")
+FRAMES_ANALYZED = registry.counter("coach_vision_frames_analyzed_total", "Vision frames analyzed.")
+FRAMES_DROPPED = registry.counter("coach_vision_frames_dropped_total", "Vision frames replaced before analysis.")
+SUGGESTION_CACHE_HITS = registry.counter(
+    "coach_suggestion_cache_hits_total", "Suggestion runs answered from the result cache."
+)
+SUGGESTION_CACHE_MISSES = registry.counter(
+    "coach_suggestion_cache_misses_total", "Suggestion runs that missed the result cache."
+)
+SUGGESTION_TIER_RUNS = registry.counter_family(
+    "coach_suggestion_tier_runs_total", "Suggestion runs admitted at each quality tier.", "tier"
+)
+AUDIO_CHUNKS_DECODED = registry.counter("coach_audio_chunks_decoded_total", "Audio chunks fed to Vosk.")
+
+
+def stage_timer(stage: str) -> Histogram:
+    return STAGE_SECONDS.labels(stage)
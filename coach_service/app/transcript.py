@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+from array import array
+from typing import BinaryIO, Iterator, List, Optional
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+
+from .cache import fingerprint
+from .config import settings
+from .schemas import TranscriptMessage
+
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<qBI")
+WRITE_BUFFER_BYTES = 65536
+SPEAKERS = ("rep", "prospect")
+
+
+def transcript_dir() -> str:
+    return settings.transcript_dir or os.path.join(settings.state_dir, "transcripts")
+
+
+def transcript_path(directory: str, session_id: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9_.-]", "_", session_id)[:48]
+    return os.path.join(directory, f"{slug}-{fingerprint(session_id)}.log")
+
+
+def checkpoint_path(log_path: str) -> str:
+    return f"{log_path}.summary"
+
+
+def rotate_idle(path: str, idle_sec: float) -> None:
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return
+    if time.time() - mtime < idle_sec:
+        return
+    archived = f"{path[:-4]}.{int(mtime)}.log"
+    try:
+        os.replace(path, archived)
+        if os.path.exists(checkpoint_path(path)):
+            os.replace(checkpoint_path(path), checkpoint_path(archived))
+    except OSError:
+        logger.exception("Cannot rotate transcript log %s", path)
+
+
+def prune_transcripts(directory: str, max_age_sec: float) -> int:
+    cutoff = time.time() - max_age_sec
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.name.endswith((".log", ".summary", ".tmp")):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+class TranscriptLog:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.offsets = array("q")
+        self.size = 0
+        self.failed = False
+        self.handle: Optional[BinaryIO] = None
+        if os.path.exists(path):
+            self._scan()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _scan(self) -> None:
+        with open(self.path, "rb") as handle:
+            end = os.fstat(handle.fileno()).st_size
+            offset = 0
+            while offset + RECORD_HEADER.size <= end:
+                handle.seek(offset)
+                _, _, length = RECORD_HEADER.unpack(handle.read(RECORD_HEADER.size))
+                if offset + RECORD_HEADER.size + length > end:
+                    break
+                self.offsets.append(offset)
+                offset += RECORD_HEADER.size + length
+        if offset < end:
+            os.truncate(self.path, offset)
+        self.size = offset
+
+    def append(self, messages: List[TranscriptMessage]) -> int:
+        start = len(self.offsets)
+        if self.failed:
+            return start
+        chunks = []
+        offsets = []
+        offset = self.size
+        for message in messages:
+            text = message.text.encode("utf-8")
+            chunks.append(RECORD_HEADER.pack(message.timestamp_ms, SPEAKERS.index(message.speaker), len(text)))
+            chunks.append(text)
+            offsets.append(offset)
+            offset += RECORD_HEADER.size + len(text)
+        try:
+            if self.handle is None:
+                self.handle = open(self.path, "ab", buffering=WRITE_BUFFER_BYTES)
+            self.handle.write(b"".join(chunks))
+        except OSError:
+            self._fail()
+            return start
+        self.offsets.extend(offsets)
+        self.size = offset
+        return start
+
+    def flush(self) -> None:
+        handle = self.handle
+        if handle is None or self.failed:
+            return
+        try:
+            handle.flush()
+        except ValueError:
+            return
+        except OSError:
+            self._fail()
+
+    def close(self) -> None:
+        self.flush()
+        handle, self.handle = self.handle, None
+        if handle is not None:
+            try:
+                handle.close()
+            except OSError:
+                pass
+
+    def _fail(self) -> None:
+        logger.exception("Transcript log %s failed, disabling it", self.path)
+        self.failed = True
+
+    def read(self, indices: List[int]) -> List[TranscriptMessage]:
+        if not indices or self.size == 0:
+            return []
+        self.flush()
+        with open(self.path, "rb") as handle, mmap.mmap(handle.fileno(), self.size, access=mmap.ACCESS_READ) as view:
+            return [self._decode(view, self.offsets[i]) for i in indices]
+
+    def iter_messages(self, start: int = 0, stop: Optional[int] = None) -> Iterator[TranscriptMessage]:
+        stop = len(self.offsets) if stop is None else min(stop, len(self.offsets))
+        if start >= stop:
+            return
+        self.flush()
+        with open(self.path, "rb") as handle, mmap.mmap(handle.fileno(), self.size, access=mmap.ACCESS_READ) as view:
+            for i in range(start, stop):
+                yield self._decode(view, self.offsets[i])
+
+    def _decode(self, view: mmap.mmap, offset: int) -> TranscriptMessage:
+        timestamp_ms, speaker, length = RECORD_HEADER.unpack_from(view, offset)
+        start = offset + RECORD_HEADER.size
+        return TranscriptMessage.model_construct(
+            speaker=SPEAKERS[speaker],
+            text=view[start:start + length].decode("utf-8"),
+            timestamp_ms=timestamp_ms,
+        )
+
+
+def open_transcript(session_id: str) -> Optional[TranscriptLog]:
+    if not settings.transcript_log:
+        return None
+    directory = transcript_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        logger.exception("Cannot create transcript directory %s", directory)
+        return None
+    path = transcript_path(directory, session_id)
+    rotate_idle(path, settings.transcript_resume_sec)
+    return TranscriptLog(path)
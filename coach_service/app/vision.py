@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Any, Optional, Tuple
+import threading
+
 import cv2
 import numpy as np
-import mediapipe as mp
 
 
 @dataclass
@@ -13,29 +14,141 @@ class VisionResult:
     gaze_score: float
 
 
+@dataclass
+class VisionStats:
+    frames_received: int = 0
+    frames_analyzed: int = 0
+    frames_dropped: int = 0
+
+
+@dataclass
+class FaceTrack:
+    detect_interval: int = 10
+    min_match_score: float = 0.6
+    smoothing: float = 0.3
+    bbox: Optional[Tuple[int, int, int, int]] = None
+    template: Optional[np.ndarray] = None
+    frames_since_detect: int = 0
+    gaze: Optional[float] = None
+    detections: int = 0
+    tracked: int = 0
+
+    def reset(self) -> None:
+        self.bbox = None
+        self.template = None
+        self.gaze = None
+
+    def smooth(self, gaze: float) -> float:
+        if self.gaze is None:
+            self.gaze = gaze
+        else:
+            self.gaze = self.smoothing * gaze + (1.0 - self.smoothing) * self.gaze
+        return self.gaze
+
+
+DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
 class VisionEngine:
-    def __init__(self) -> None:
-        self.detector = mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+    def __init__(self, decode_scale: int = 1) -> None:
+        if decode_scale not in DECODE_FLAGS:
+            raise ValueError(f"Unsupported decode scale: {decode_scale}")
+        self.decode_flag = DECODE_FLAGS[decode_scale]
+        self.local = threading.local()
+
+    @property
+    def detector(self) -> Any:
+        detector = getattr(self.local, "detector", None)
+        if detector is None:
+            import mediapipe as mp
 
-    def analyze(self, jpeg_bytes: bytes) -> VisionResult:
+            detector = mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+            self.local.detector = detector
+        return detector
+
+    def warm_up(self) -> None:
+        ok, encoded = cv2.imencode(".jpg", np.zeros((64, 64, 3), dtype=np.uint8))
+        if ok:
+            self.analyze(encoded.tobytes())
+
+    def analyze(self, jpeg_bytes: bytes, track: Optional[FaceTrack] = None) -> VisionResult:
         image = self._decode(jpeg_bytes)
         if image is None:
             return VisionResult(face_present=False, gaze_score=0.0)
+        if track is None:
+            bbox = self._detect(image)
+        else:
+            bbox = self._track_or_detect(image, track)
+        if bbox is None:
+            if track is not None:
+                track.reset()
+            return VisionResult(face_present=False, gaze_score=0.0)
+        height, width, _ = image.shape
+        x, y, w, h = bbox
+        center_x = (x + w / 2.0) / width
+        center_y = (y + h / 2.0) / height
+        gaze_score = self._gaze_proxy(center_x, center_y)
+        if track is not None:
+            gaze_score = track.smooth(gaze_score)
+        return VisionResult(face_present=True, gaze_score=gaze_score)
+
+    def _detect(self, image: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
         height, width, _ = image.shape
         rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         result = self.detector.process(rgb)
         if not result.detections:
-            return VisionResult(face_present=False, gaze_score=0.0)
-        detection = result.detections[0]
-        bbox = detection.location_data.relative_bounding_box
-        center_x = bbox.xmin + bbox.width / 2.0
-        center_y = bbox.ymin + bbox.height / 2.0
-        gaze_score = self._gaze_proxy(center_x, center_y)
-        return VisionResult(face_present=True, gaze_score=gaze_score)
+            return None
+        bbox = result.detections[0].location_data.relative_bounding_box
+        x = max(0, int(bbox.xmin * width))
+        y = max(0, int(bbox.ymin * height))
+        w = min(width - x, int(bbox.width * width))
+        h = min(height - y, int(bbox.height * height))
+        if w <= 0 or h <= 0:
+            return None
+        return x, y, w, h
+
+    def _track_or_detect(self, image: np.ndarray, track: FaceTrack) -> Optional[Tuple[int, int, int, int]]:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if track.bbox is not None and track.frames_since_detect < track.detect_interval:
+            bbox = self._match(gray, track)
+            if bbox is not None:
+                track.bbox = bbox
+                track.frames_since_detect += 1
+                track.tracked += 1
+                return bbox
+        bbox = self._detect(image)
+        track.detections += 1
+        track.frames_since_detect = 0
+        if bbox is None:
+            return None
+        x, y, w, h = bbox
+        track.bbox = bbox
+        track.template = gray[y:y + h, x:x + w].copy()
+        return bbox
+
+    def _match(self, gray: np.ndarray, track: FaceTrack) -> Optional[Tuple[int, int, int, int]]:
+        x, y, w, h = track.bbox
+        height, width = gray.shape
+        margin_x, margin_y = w // 2, h // 2
+        left, top = max(0, x - margin_x), max(0, y - margin_y)
+        right, bottom = min(width, x + w + margin_x), min(height, y + h + margin_y)
+        region = gray[top:bottom, left:right]
+        if region.shape[0] < h or region.shape[1] < w:
+            return None
+        scores = cv2.matchTemplate(region, track.template, cv2.TM_CCOEFF_NORMED)
+        _, best, _, (dx, dy) = cv2.minMaxLoc(scores)
+        if best < track.min_match_score:
+            return None
+        return left + dx, top + dy, w, h
 
     def _decode(self, jpeg_bytes: bytes) -> np.ndarray | None:
         data = np.frombuffer(jpeg_bytes, dtype=np.uint8)
-        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        image = cv2.imdecode(data, self.decode_flag)
         return image
 
     def _gaze_proxy(self, cx: float, cy: float) -> float:
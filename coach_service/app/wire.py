@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from importlib.util import find_spec
+from typing import Any, List, Union
+import json
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import TypeAdapter
+
+from .schemas import TranscriptMessage
+
+
+MSGPACK_SUBPROTOCOL = "coach.msgpack.v1"
+FORMATS = {"json", "msgpack"}
+
+MESSAGE_LIST = TypeAdapter(List[TranscriptMessage])
+
+Frame = Union[str, bytes]
+
+
+def msgpack_available() -> bool:
+    return find_spec("msgpack") is not None
+
+
+def packb(obj: Any) -> bytes:
+    import msgpack
+
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpackb(data: bytes) -> Any:
+    import msgpack
+
+    return msgpack.unpackb(data, raw=False)
+
+
+async def accept(websocket: WebSocket, fmt: str) -> bool:
+    offered = MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    binary = (fmt == "msgpack" or offered) and msgpack_available()
+    await websocket.accept(subprotocol=MSGPACK_SUBPROTOCOL if binary and offered else None)
+    if fmt not in FORMATS or (fmt == "msgpack" and not binary):
+        await websocket.close(code=1003, reason=f"Unsupported format {fmt}")
+        raise WebSocketDisconnect(code=1003)
+    return binary
+
+
+async def receive(websocket: WebSocket) -> Frame:
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(code=message.get("code", 1000))
+    data = message.get("bytes")
+    return data if data is not None else message.get("text", "")
+
+
+def decode_messages(frame: Frame, binary: bool) -> Union[TranscriptMessage, List[TranscriptMessage]]:
+    if binary and isinstance(frame, bytes):
+        data = unpackb(frame)
+        if isinstance(data, list):
+            return MESSAGE_LIST.validate_python(data)
+        return TranscriptMessage.model_validate(data)
+    if frame.lstrip()[:1] in ("[", b"["):
+        return MESSAGE_LIST.validate_json(frame)
+    return TranscriptMessage.model_validate_json(frame)
+
+
+def decode_control(frame: Frame, binary: bool) -> Any:
+    if isinstance(frame, str):
+        return frame
+    if binary:
+        try:
+            return unpackb(frame)
+        except Exception:
+            return None
+    return frame.decode("utf-8", errors="replace")
+
+
+def encode(obj: Any, binary: bool) -> Frame:
+    return packb(obj) if binary else json.dumps(obj)
+
+
+async def send(websocket: WebSocket, obj: Any, binary: bool) -> None:
+    if binary:
+        await websocket.send_bytes(packb(obj))
+    else:
+        await websocket.send_text(json.dumps(obj))
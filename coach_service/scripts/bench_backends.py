@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from coach_service.app.config import settings  # noqa: E402
+from coach_service.app.generation import GenerationConfig, template_candidates  # noqa: E402
+from coach_service.app.inference import BACKENDS, backend_spec, load_cross_encoder, load_embedder  # noqa: E402
+from simulate_transcript import SAMPLE_DIALOG  # noqa: E402
+
+
+STAGES = ["connect", "situation", "problem", "awareness", "solution", "closing"]
+
+
+def sample_texts() -> List[str]:
+    lines = [text for _, text in SAMPLE_DIALOG]
+    contexts = [" ".join(lines[: i + 1]) for i in range(len(lines))]
+    return lines + contexts
+
+
+def sample_pairs() -> List[List[str]]:
+    lines = [text for _, text in SAMPLE_DIALOG]
+    pairs = []
+    for i in range(len(lines)):
+        context = " ".join(lines[: i + 1])
+        for stage in STAGES:
+            pairs.extend([context, c] for c in template_candidates(stage))
+    return pairs
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm", encoding="utf-8") as handle:
+        pages = int(handle.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def time_calls(fn: Callable[[], object], repeats: int) -> Dict[str, float]:
+    fn()
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "mean_ms": float(np.mean(samples)),
+    }
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    spec = backend_spec(args.worker, args.model_file, args.threads)
+    baseline = rss_mb()
+    texts = sample_texts()
+    pairs = sample_pairs()
+    rerank_size = len(template_candidates("connect")) + settings.top_k
+    if settings.rerank_shortlist:
+        rerank_size = min(rerank_size, settings.rerank_shortlist)
+
+    started = time.perf_counter()
+    embedder = load_embedder(settings.model_name, spec)
+    embedder_load = time.perf_counter() - started
+    started = time.perf_counter()
+    cross_encoder = load_cross_encoder(GenerationConfig().cross_encoder_model, spec)
+    cross_encoder_load = time.perf_counter() - started
+
+    embeddings = embedder.encode(texts, normalize_embeddings=True)
+    scores = cross_encoder.predict(pairs)
+    np.savez(args.output, embeddings=embeddings, scores=scores)
+
+    result = {
+        "backend": spec.name,
+        "runtime": spec.runtime,
+        "model_kwargs": {k: v for k, v in spec.model_kwargs().items() if isinstance(v, (str, int))},
+        "load_sec": {"embedder": embedder_load, "cross_encoder": cross_encoder_load},
+        "latency": {
+            "embed_1": time_calls(lambda: embedder.encode(texts[-1:], normalize_embeddings=True), args.repeats),
+            f"embed_{len(texts)}": time_calls(lambda: embedder.encode(texts, normalize_embeddings=True), args.repeats),
+            f"rerank_{rerank_size}": time_calls(lambda: cross_encoder.predict(pairs[:rerank_size]), args.repeats),
+            f"rerank_{len(pairs)}": time_calls(lambda: cross_encoder.predict(pairs), args.repeats),
+        },
+        "memory_mb": {
+            "baseline_rss": baseline,
+            "rss": rss_mb(),
+            "models_rss": rss_mb() - baseline,
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+    }
+    print(json.dumps(result))
+
+
+def parity(reference: Dict[str, np.ndarray], other: Dict[str, np.ndarray]) -> Dict[str, float]:
+    cosine = np.sum(reference["embeddings"] * other["embeddings"], axis=1)
+    ref_scores = reference["scores"].reshape(-1, 2)
+    other_scores = other["scores"].reshape(-1, 2)
+    return {
+        "embedding_cosine_min": float(cosine.min()),
+        "embedding_cosine_mean": float(cosine.mean()),
+        "score_max_abs_diff": float(np.abs(reference["scores"] - other["scores"]).max()),
+        "pair_order_agreement": float(
+            np.mean(np.argmax(ref_scores, axis=1) == np.argmax(other_scores, axis=1))
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare embedder and cross-encoder latency, memory and output parity across inference backends."
+    )
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8", help=f"Comma separated, from {', '.join(BACKENDS)}")
+    parser.add_argument("--model-file", default="", help="ONNX file inside the model repo, e.g. onnx/model_qint8_avx512_vnni.onnx")
+    parser.add_argument("--threads", type=int, default=-1, help="Intra-op threads per model, -1 uses COACH_INFERENCE_THREADS")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Fail when any embedding drifts below this cosine")
+    parser.add_argument("--min-order-agreement", type=float, default=0.95, help="Fail when reranking flips more pairs than this")
+    parser.add_argument("--output", default="bench_backends.json")
+    parser.add_argument("--worker", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    backends = [b for b in args.backends.split(",") if b]
+    if "torch" in backends:
+        backends.remove("torch")
+    backends.insert(0, "torch")
+
+    results = []
+    outputs: Dict[str, Dict[str, np.ndarray]] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in backends:
+            path = os.path.join(tmp, f"{name}.npz")
+            command = [
+                sys.executable, __file__, "--worker", name, "--output", path,
+                "--repeats", str(args.repeats), "--threads", str(args.threads),
+            ]
+            if args.model_file and name != "torch":
+                command += ["--model-file", args.model_file]
+            proc = subprocess.run(command, capture_output=True, text=True)
+            if proc.returncode != 0:
+                results.append({"backend": name, "error": proc.stderr.strip().splitlines()[-1:]})
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            with np.load(path) as data:
+                outputs[name] = {k: data[k] for k in data.files}
+
+    reference = outputs.get("torch")
+    failed = [result["backend"] for result in results if "error" in result]
+    for result in results:
+        name = result["backend"]
+        if name not in outputs or name == "torch":
+            continue
+        if reference is None:
+            failed.append(f"{name} (no torch reference for parity)")
+            continue
+        result["parity"] = parity(reference, outputs[name])
+        ok = (
+            result["parity"]["embedding_cosine_min"] >= args.min_cosine
+            and result["parity"]["pair_order_agreement"] >= args.min_order_agreement
+        )
+        result["parity"]["ok"] = ok
+        if not ok:
+            failed.append(name)
+
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(
+            {
+                "timestamp": int(time.time()),
+                "machine": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+                "config": vars(args),
+                "results": results,
+            },
+            handle,
+            indent=2,
+        )
+
+    torch_latency = next((r["latency"] for r in results if r["backend"] == "torch" and "latency" in r), None)
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']}: failed to load: {' '.join(result['error'])}")
+            continue
+        parts = []
+        for op, stats in result["latency"].items():
+            speedup = ""
+            if torch_latency and result["backend"] != "torch":
+                speedup = f" ({torch_latency[op]['p50_ms'] / stats['p50_ms']:.1f}x)"
+            parts.append(f"{op} p50={stats['p50_ms']:.1f}ms{speedup}")
+        line = f"{result['backend']}: {', '.join(parts)}, models {result['memory_mb']['models_rss']:.0f}MB"
+        if "parity" in result:
+            p = result["parity"]
+            line += (
+                f", cosine min {p['embedding_cosine_min']:.4f}, score diff {p['score_max_abs_diff']:.3f},"
+                f" order agreement {p['pair_order_agreement']:.2f}{'' if p['ok'] else ' PARITY FAILED'}"
+            )
+        print(line)
+    print(f"Wrote {args.output}")
+    if failed:
+        raise SystemExit(f"Benchmark failed for {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
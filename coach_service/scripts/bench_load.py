@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import time
+import urllib.request
+import uuid
+import wave
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+import websockets
+
+from simulate_transcript import SAMPLE_DIALOG
+
+
+DRAIN_TIMEOUT_SEC = 10.0
+
+
+@dataclass
+class PendingMessage:
+    sent: float
+    ingested_ms: int = 0
+    ui_done: bool = False
+    suggestion_done: bool = False
+
+
+@dataclass
+class Recorder:
+    ack: List[float] = field(default_factory=list)
+    ui_update: List[float] = field(default_factory=list)
+    suggestion: List[float] = field(default_factory=list)
+    audio_ack: List[float] = field(default_factory=list)
+    vision_ack: List[float] = field(default_factory=list)
+    messages_sent: int = 0
+    messages_acked: int = 0
+    ui_updates: int = 0
+    audio_chunks_sent: int = 0
+    audio_chunks_acked: int = 0
+    vision_frames_sent: int = 0
+    vision_frames_acked: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) if values else None,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": max(values) if values else None,
+    }
+
+
+async def watch_ui(base: str, session_id: str, pending: List[PendingMessage], rec: Recorder, stop: asyncio.Event) -> None:
+    async with websockets.connect(f"{base}/ws/ui?session_id={session_id}") as ws:
+        while not stop.is_set():
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            if raw == "pong":
+                continue
+            now = time.perf_counter()
+            payload = json.loads(raw)
+            rec.ui_updates += 1
+            updated_ms = payload.get("last_update_ms", 0)
+            say_next_ms = payload.get("say_next_ms", 0)
+            for item in pending:
+                if not item.ingested_ms:
+                    continue
+                if not item.ui_done and updated_ms >= item.ingested_ms:
+                    item.ui_done = True
+                    rec.ui_update.append((now - item.sent) * 1000)
+                if not item.suggestion_done and say_next_ms >= item.ingested_ms:
+                    item.suggestion_done = True
+                    rec.suggestion.append((now - item.sent) * 1000)
+            pending[:] = [p for p in pending if not (p.ui_done and p.suggestion_done)]
+
+
+InFlight = Deque[Tuple[float, Optional[PendingMessage]]]
+
+
+async def schedule(rate: float, duration: float) -> AsyncIterator[float]:
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    count = 0
+    while True:
+        scheduled = start + count * interval
+        if scheduled >= start + duration:
+            return
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield scheduled
+        count += 1
+
+
+async def read_acks(ws: websockets.WebSocketClientProtocol, in_flight: InFlight, samples: List[float], rec: Recorder) -> None:
+    async for raw in ws:
+        if isinstance(raw, str) and raw.startswith("error:"):
+            rec.errors.append(raw)
+            continue
+        now = time.perf_counter()
+        if not in_flight:
+            continue
+        scheduled, item = in_flight.popleft()
+        samples.append((now - scheduled) * 1000)
+        if item is not None:
+            item.ingested_ms = json.loads(raw).get("ingested_ms", 0)
+
+
+async def drain(in_flight: InFlight, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while in_flight and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def run_ingest(base: str, session_id: str, rate: float, duration: float, rec: Recorder) -> None:
+    pending: List[PendingMessage] = []
+    in_flight: InFlight = deque()
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_ui(base, session_id, pending, rec, stop))
+    await asyncio.sleep(0.2)
+    turn = 0
+    async with websockets.connect(f"{base}/ws/ingest?session_id={session_id}") as ws:
+        reader = asyncio.create_task(read_acks(ws, in_flight, rec.ack, rec))
+        async for scheduled in schedule(rate, duration):
+            speaker, text = SAMPLE_DIALOG[turn % len(SAMPLE_DIALOG)]
+            turn += 1
+            item = PendingMessage(sent=scheduled)
+            pending.append(item)
+            in_flight.append((scheduled, item))
+            await ws.send(json.dumps({"speaker": speaker, "text": text, "timestamp_ms": int(time.time() * 1000)}))
+        await drain(in_flight, DRAIN_TIMEOUT_SEC)
+        reader.cancel()
+    rec.messages_sent += turn
+    rec.messages_acked += turn - len(in_flight)
+    await asyncio.sleep(1.0)
+    stop.set()
+    await watcher
+
+
+def load_wav_chunks(path: str, chunk_ms: int) -> List[bytes]:
+    with wave.open(path, "rb") as handle:
+        if handle.getframerate() != 16000 or handle.getnchannels() != 1 or handle.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16 kHz mono 16-bit PCM")
+        frames_per_chunk = 16000 * chunk_ms // 1000
+        chunks = []
+        while True:
+            data = handle.readframes(frames_per_chunk)
+            if not data:
+                break
+            chunks.append(data)
+    return chunks
+
+
+async def run_audio(base: str, session_id: str, chunks: List[bytes], chunk_ms: int, duration: float, rec: Recorder) -> None:
+    in_flight: InFlight = deque()
+    sent = 0
+    async with websockets.connect(f"{base}/ws/audio?session_id={session_id}&ack_every=1") as ws:
+        reader = asyncio.create_task(read_acks(ws, in_flight, rec.audio_ack, rec))
+        async for scheduled in schedule(1000 / chunk_ms, duration):
+            in_flight.append((scheduled, None))
+            await ws.send(chunks[sent % len(chunks)])
+            sent += 1
+        await drain(in_flight, DRAIN_TIMEOUT_SEC)
+        reader.cancel()
+    rec.audio_chunks_sent += sent
+    rec.audio_chunks_acked += sent - len(in_flight)
+
+
+async def run_vision(base: str, session_id: str, frames: List[bytes], fps: float, duration: float, rec: Recorder) -> None:
+    in_flight: InFlight = deque()
+    sent = 0
+    async with websockets.connect(f"{base}/ws/vision?session_id={session_id}") as ws:
+        reader = asyncio.create_task(read_acks(ws, in_flight, rec.vision_ack, rec))
+        async for scheduled in schedule(fps, duration):
+            in_flight.append((scheduled, None))
+            await ws.send(frames[sent % len(frames)])
+            sent += 1
+        await drain(in_flight, DRAIN_TIMEOUT_SEC)
+        reader.cancel()
+    rec.vision_frames_sent += sent
+    rec.vision_frames_acked += sent - len(in_flight)
+
+
+async def guarded(coro, rec: Recorder) -> None:
+    try:
+        await coro
+    except Exception as exc:
+        rec.errors.append(f"{type(exc).__name__}: {exc}")
+
+
+def wait_ready(host: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://{host}/readyz", timeout=5) as response:
+                if response.status == 200:
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def fetch_stats(host: str) -> Optional[dict]:
+    try:
+        with urllib.request.urlopen(f"http://{host}/stats", timeout=5) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated calls and record end-to-end latency.")
+    parser.add_argument("--host", default="127.0.0.1:8000")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent /ws/ingest calls")
+    parser.add_argument("--rate", type=float, default=1.0, help="Transcript messages per second per call")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to drive load")
+    parser.add_argument("--audio-sessions", type=int, default=0)
+    parser.add_argument("--audio-glob", default="", help="16 kHz mono WAV files to replay")
+    parser.add_argument("--audio-chunk-ms", type=int, default=100)
+    parser.add_argument("--vision-sessions", type=int, default=0)
+    parser.add_argument("--vision-glob", default="", help="JPEG frames to replay in sorted order")
+    parser.add_argument("--vision-fps", type=float, default=15.0)
+    parser.add_argument("--ready-timeout", type=float, default=120.0, help="Seconds to wait for /readyz before starting")
+    parser.add_argument("--label", default="", help="Free-form label stored with the results")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    if not wait_ready(args.host, args.ready_timeout):
+        raise SystemExit(f"{args.host} did not report ready within {args.ready_timeout:.0f}s")
+    base = f"ws://{args.host}"
+    run_id = uuid.uuid4().hex[:8]
+    rec = Recorder()
+    tasks = []
+    for i in range(args.sessions):
+        tasks.append(guarded(run_ingest(base, f"bench-{run_id}-{i}", args.rate, args.duration, rec), rec))
+    if args.audio_sessions:
+        paths = sorted(glob.glob(args.audio_glob))
+        if not paths:
+            raise SystemExit("--audio-sessions needs --audio-glob matching WAV files")
+        wavs = [load_wav_chunks(p, args.audio_chunk_ms) for p in paths]
+        for i in range(args.audio_sessions):
+            chunks = wavs[i % len(wavs)]
+            tasks.append(guarded(run_audio(base, f"bench-{run_id}-{i}", chunks, args.audio_chunk_ms, args.duration, rec), rec))
+    if args.vision_sessions:
+        paths = sorted(glob.glob(args.vision_glob))
+        if not paths:
+            raise SystemExit("--vision-sessions needs --vision-glob matching JPEG files")
+        frames = []
+        for path in paths:
+            with open(path, "rb") as handle:
+                frames.append(handle.read())
+        for i in range(args.vision_sessions):
+            tasks.append(guarded(run_vision(base, f"bench-{run_id}-{i}", frames, args.vision_fps, args.duration, rec), rec))
+
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    results = {
+        "run_id": run_id,
+        "label": args.label,
+        "timestamp": int(time.time()),
+        "host": args.host,
+        "client": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "elapsed_sec": elapsed,
+        "latency": {
+            "ingest_ack": summarize(rec.ack),
+            "ui_update": summarize(rec.ui_update),
+            "suggestion": summarize(rec.suggestion),
+            "audio_ack": summarize(rec.audio_ack),
+            "vision_ack": summarize(rec.vision_ack),
+        },
+        "throughput": {
+            "messages_per_sec": rec.messages_acked / elapsed if elapsed else 0.0,
+            "suggestions_per_sec": len(rec.suggestion) / elapsed if elapsed else 0.0,
+            "ui_updates_per_sec": rec.ui_updates / elapsed if elapsed else 0.0,
+            "audio_chunks_per_sec": rec.audio_chunks_sent / elapsed if elapsed else 0.0,
+            "vision_frames_per_sec": rec.vision_frames_sent / elapsed if elapsed else 0.0,
+        },
+        "counts": {
+            "messages_sent": rec.messages_sent,
+            "messages_acked": rec.messages_acked,
+            "ui_updates": rec.ui_updates,
+            "audio_chunks_sent": rec.audio_chunks_sent,
+            "audio_chunks_acked": rec.audio_chunks_acked,
+            "vision_frames_sent": rec.vision_frames_sent,
+            "vision_frames_acked": rec.vision_frames_acked,
+        },
+        "errors": rec.errors,
+        "server_stats": fetch_stats(args.host),
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+
+    for name, stats in results["latency"].items():
+        if stats["count"]:
+            print(f"{name}: n={stats['count']} p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms")
+    print(f"throughput: {results['throughput']['messages_per_sec']:.1f} msg/s, {results['throughput']['suggestions_per_sec']:.1f} suggestions/s")
+    if rec.errors:
+        print(f"{len(rec.errors)} connection errors, see {args.output}")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,40 @@
+import argparse
+import os
+import sys
+
+from sentence_transformers import SentenceTransformer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from coach_service.app.config import settings  # noqa: E402
+from coach_service.app.playbook import INDEX_TYPES, build_playbook  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build a memory-mapped playbook index from a JSONL or CSV corpus.")
+    parser.add_argument("corpus", help="JSONL or CSV file with line, stage and tags columns")
+    parser.add_argument("output", help="Directory to write the playbook artifact to")
+    parser.add_argument("--index", choices=sorted(INDEX_TYPES), default="hnsw")
+    parser.add_argument("--nlist", type=int, default=1024, help="IVF cell count")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbours per node")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW build-time search depth")
+    parser.add_argument("--batch-size", type=int, default=512)
+    args = parser.parse_args()
+
+    model = SentenceTransformer(settings.model_name)
+    count = build_playbook(
+        args.corpus,
+        args.output,
+        encode=lambda texts: model.encode(texts, normalize_embeddings=True),
+        model_name=settings.model_name,
+        index_type=args.index,
+        batch_size=args.batch_size,
+        nlist=args.nlist,
+        hnsw_m=args.hnsw_m,
+        ef_construction=args.ef_construction,
+    )
+    print(f"Wrote {count} lines to {args.output}")
+
+
+if __name__ == "__main__":
+    main()